@@ -0,0 +1,32 @@
+"""partial index on auctions effective end time for the scheduler scan
+
+Revision ID: 20261016_01
+Revises: 20250921_01
+Create Date: 2026-10-16
+"""
+
+from __future__ import annotations
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "20261016_01"
+down_revision = "20250921_01"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # הסריקה הדחופה מסננת מכרזים פעילים לפי COALESCE(extended_until, ends_at)
+    op.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_auctions_effective_end_active
+        ON auctions ((COALESCE(extended_until, ends_at)))
+        WHERE status = 'ACTIVE';
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS idx_auctions_effective_end_active;")
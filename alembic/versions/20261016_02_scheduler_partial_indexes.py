@@ -0,0 +1,49 @@
+"""partial indexes for the scheduler's hot predicates
+
+Revision ID: 20261016_02
+Revises: 20261016_01
+Create Date: 2026-10-16
+"""
+
+from __future__ import annotations
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "20261016_02"
+down_revision = "20261016_01"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    statements = [
+        # תזכורות לפני סגירת חלון דיווח (כל דקה)
+        """
+        CREATE INDEX IF NOT EXISTS idx_orders_dispute_window_open
+        ON orders (dispute_window_until)
+        WHERE status = 'DELIVERED' AND reported_at IS NULL;
+        """,
+        # שחרור holds למוכרים (כל 5 דקות)
+        """
+        CREATE INDEX IF NOT EXISTS idx_orders_hold_release_pending
+        ON orders (seller_hold_until)
+        WHERE status = 'DELIVERED' AND buyer_confirmed_at IS NULL;
+        """,
+        # סימון קופונים שפגו והתראות תפוגה (כל שעה / 15 דקות)
+        """
+        CREATE INDEX IF NOT EXISTS idx_coupons_expiry_active
+        ON coupons (expires_at)
+        WHERE status = 'ACTIVE';
+        """,
+    ]
+
+    for stmt in statements:
+        op.execute(stmt)
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS idx_coupons_expiry_active;")
+    op.execute("DROP INDEX IF EXISTS idx_orders_hold_release_pending;")
+    op.execute("DROP INDEX IF EXISTS idx_orders_dispute_window_open;")
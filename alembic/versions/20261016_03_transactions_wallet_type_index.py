@@ -0,0 +1,31 @@
+"""covering index for per-wallet transaction sums by type
+
+Revision ID: 20261016_03
+Revises: 20261016_02
+Create Date: 2026-10-16
+"""
+
+from __future__ import annotations
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "20261016_03"
+down_revision = "20261016_02"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # סטטיסטיקות ארנק: SUM(amount) לפי wallet_id + type ללא גישה לטבלה
+    op.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_transactions_wallet_type
+        ON transactions (wallet_id, type) INCLUDE (amount);
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS idx_transactions_wallet_type;")
@@ -0,0 +1,48 @@
+"""partial indexes for hold lookups, expired locks and transaction history
+
+Revision ID: 20261016_04
+Revises: 20261016_03
+Create Date: 2026-10-16
+"""
+
+from __future__ import annotations
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "20261016_04"
+down_revision = "20261016_03"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    statements = [
+        # release_seller_hold / process_refund - איתור ה-hold של הזמנה
+        """
+        CREATE INDEX IF NOT EXISTS idx_transactions_hold_lookup
+        ON transactions (wallet_id, reference_id)
+        WHERE type = 'HOLD_LOCK';
+        """,
+        # get_user_transaction_history - תנועות משתמש מהחדשה לישנה
+        """
+        CREATE INDEX IF NOT EXISTS idx_transactions_user_created
+        ON transactions (user_id, created_at DESC);
+        """,
+        # cleanup_expired_locks - נעילות פעילות שפגו
+        """
+        CREATE INDEX IF NOT EXISTS idx_fund_locks_expiry_active
+        ON fund_locks (expires_at)
+        WHERE is_active;
+        """,
+    ]
+
+    for stmt in statements:
+        op.execute(stmt)
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS idx_fund_locks_expiry_active;")
+    op.execute("DROP INDEX IF EXISTS idx_transactions_user_created;")
+    op.execute("DROP INDEX IF EXISTS idx_transactions_hold_lookup;")
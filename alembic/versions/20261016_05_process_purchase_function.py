@@ -0,0 +1,95 @@
+"""process_purchase: server-side purchase flow in a single round trip
+
+Revision ID: 20261016_05
+Revises: 20261016_04
+Create Date: 2026-10-16
+"""
+
+from __future__ import annotations
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "20261016_05"
+down_revision = "20261016_04"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # חיוב הקונה + hold למוכר + שתי התנועות - הכל בטרנזקציה אחת בצד השרת.
+    # העמלות מחושבות באפליקציה (calculate_fees) ומועברות כסכומים סופיים
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION process_purchase(
+            p_buyer_id BIGINT,
+            p_seller_id BIGINT,
+            p_buyer_total NUMERIC,
+            p_seller_net NUMERIC,
+            p_order_id TEXT,
+            p_buyer_description TEXT,
+            p_seller_description TEXT
+        ) RETURNS SETOF transactions
+        LANGUAGE plpgsql
+        AS $$
+        DECLARE
+            v_buyer wallets%ROWTYPE;
+            v_seller wallets%ROWTYPE;
+        BEGIN
+            -- created_at / updated_at במפורש: בסכמת create_all אין להן DEFAULT בצד השרת
+            INSERT INTO wallets (user_id, total_balance, locked_balance, created_at, updated_at)
+            VALUES (p_buyer_id, 0, 0, NOW(), NOW()), (p_seller_id, 0, 0, NOW(), NOW())
+            ON CONFLICT (user_id) DO NOTHING;
+
+            -- חיוב מותנה ביתרה זמינה (נעילת השורה עד סוף הטרנזקציה)
+            UPDATE wallets
+            SET total_balance = total_balance - p_buyer_total,
+                updated_at = NOW()
+            WHERE user_id = p_buyer_id
+              AND total_balance - locked_balance >= p_buyer_total
+            RETURNING * INTO v_buyer;
+
+            IF NOT FOUND THEN
+                RAISE EXCEPTION 'insufficient_funds' USING ERRCODE = 'P0001';
+            END IF;
+
+            UPDATE wallets
+            SET locked_balance = locked_balance + p_seller_net,
+                updated_at = NOW()
+            WHERE user_id = p_seller_id
+            RETURNING * INTO v_seller;
+
+            RETURN QUERY
+            INSERT INTO transactions (
+                id, user_id, wallet_id, type, amount, description,
+                reference_type, reference_id,
+                balance_before, balance_after, locked_before, locked_after,
+                created_at
+            )
+            VALUES
+                (
+                    gen_random_uuid()::text, p_buyer_id, v_buyer.id, 'PURCHASE_DEBIT',
+                    p_buyer_total, p_buyer_description, 'order', p_order_id,
+                    v_buyer.total_balance + p_buyer_total, v_buyer.total_balance,
+                    v_buyer.locked_balance, v_buyer.locked_balance,
+                    NOW()
+                ),
+                (
+                    gen_random_uuid()::text, p_seller_id, v_seller.id, 'HOLD_LOCK',
+                    p_seller_net, p_seller_description, 'order', p_order_id,
+                    v_seller.total_balance, v_seller.total_balance,
+                    v_seller.locked_balance - p_seller_net, v_seller.locked_balance,
+                    NOW()
+                )
+            RETURNING *;
+        END;
+        $$;
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute(
+        "DROP FUNCTION IF EXISTS process_purchase(BIGINT, BIGINT, NUMERIC, NUMERIC, TEXT, TEXT, TEXT);"
+    )
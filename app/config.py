@@ -26,13 +26,19 @@ class Settings(BaseSettings):
     # === מסד נתונים ===
     DATABASE_URL: str = Field(..., description="כתובת מסד הנתונים")
     DATABASE_ECHO: bool = Field(default=False, description="הצגת SQL queries בלוגים")
-    DATABASE_POOL_SIZE: int = Field(default=10, description="גודל pool החיבורים")
-    DATABASE_MAX_OVERFLOW: int = Field(default=20, description="מקסימום overflow connections")
+    DATABASE_POOL_SIZE: int = Field(default=25, description="גודל pool החיבורים")
+    DATABASE_MAX_OVERFLOW: int = Field(default=25, description="מקסימום overflow connections")
+    DATABASE_POOL_RECYCLE_SECONDS: int = Field(default=1800, description="רענון חיבורים ב-pool (שניות)")
+    WALLET_PURCHASE_DB_FUNCTION: bool = Field(default=True, description="רכישה דרך הפונקציה process_purchase במסד (round trip אחד)")
     
     # === FastAPI Server ===
     HOST: str = Field(default="0.0.0.0", description="Host address")
     PORT: int = Field(default=8000, description="Port number")
     WORKERS: int = Field(default=1, description="מספר workers")
+    WEB_CONCURRENCY: int = Field(
+        default_factory=lambda: min(2 * (os.cpu_count() or 1) + 1, 8),
+        description="מספר תהליכי uvicorn במצב API בלבד (python main.py web)"
+    )
     
     # === אבטחה ===
     SECRET_KEY: str = Field(..., description="מפתח סודי להצפנה")
@@ -71,6 +77,8 @@ class Settings(BaseSettings):
     # === התראות ===
     ENABLE_NOTIFICATIONS: bool = Field(default=True, description="הפעלת התראות")
     PRICE_DROP_THRESHOLD_PERCENT: int = Field(default=10, description="אחוז ירידת מחיר להתראה")
+    TELEGRAM_SEND_RATE_PER_SECOND: int = Field(default=28, description="מקסימום הודעות לשנייה (מגבלת טלגרם ~30)")
+    TELEGRAM_DISPATCH_WORKERS: int = Field(default=4, description="מספר workers לשליחת הודעות")
     
     model_config = SettingsConfigDict(
         env_file=".env",
@@ -6,9 +6,9 @@ SQLAlchemy 2.0 + Async PostgreSQL + Connection Pooling
 import asyncio
 import logging
 from contextlib import asynccontextmanager
-from typing import AsyncGenerator, Optional
+from typing import Any, AsyncGenerator, Awaitable, Callable, Optional
 
-from sqlalchemy import text, event
+from sqlalchemy import Select, text, event
 from sqlalchemy.ext.asyncio import (
     AsyncEngine,
     AsyncSession,
@@ -60,8 +60,12 @@ class DatabaseManager:
                 pool_size=settings.DATABASE_POOL_SIZE,
                 max_overflow=settings.DATABASE_MAX_OVERFLOW,
                 pool_timeout=30,  # המתנה מקסימלית לחיבור חדש
-                pool_recycle=3600,  # רענון חיבורים כל שעה
+                pool_recycle=settings.DATABASE_POOL_RECYCLE_SECONDS,  # רענון חיבורים (ברירת מחדל: חצי שעה)
                 pool_pre_ping=True,  # בדיקת תקינות החיבור לפני שימוש
+                # ללא reset בהחזרת חיבור ל-pool: כל session מסתיים ב-commit/rollback
+                # משלו, כך שה-rollback הנוסף רק מוסיף round-trip.
+                # לכן אסור לשנות GUC ברמת ה-session (SET) - רק SET LOCAL בתוך טרנזקציה
+                pool_reset_on_return=None,
                 
                 # הגדרות performance
                 connect_args={
@@ -81,6 +85,12 @@ class DatabaseManager:
             except Exception:
                 logger.info("🧩 Database driver in use: unknown")
             
+            logger.info(
+                f"🏊 Database pool: size={settings.DATABASE_POOL_SIZE}, "
+                f"max_overflow={settings.DATABASE_MAX_OVERFLOW}, "
+                f"recycle={settings.DATABASE_POOL_RECYCLE_SECONDS}s"
+            )
+            
             # יצירת Session Maker
             self.async_session_maker = async_sessionmaker(
                 self.engine,
@@ -251,6 +261,66 @@ async def get_db_manager() -> DatabaseManager:
 
 # === Utility Functions ===
 
+# משימות after-commit שרצות ברקע (הפניה חזקה עד שמסתיימות)
+_transaction_hook_tasks: set = set()
+
+
+def run_after_transaction(
+    session: AsyncSession,
+    on_commit: Callable[[], Awaitable[None]],
+    on_rollback: Optional[Callable[[], Awaitable[None]]] = None,
+    bind_to_savepoint: bool = False
+) -> None:
+    """
+    הרצת פעולה (async) אחרי שהטרנזקציה החיצונית של ה-session מסתיימת:
+    on_commit אחרי commit, on_rollback אחרי rollback. חד-פעמי - מה שקורה ראשון.
+    commit של savepoint (begin_nested) לא נחשב סוף טרנזקציה.
+    bind_to_savepoint - גם rollback של ה-savepoint הפתוח ברגע הקריאה (או של savepoint
+    שעוטף אותו) מפעיל את on_rollback, כי השינויים שנעשו בו כבר לא ייכנסו ל-commit.
+    מיועד לתופעות לוואי מחוץ למסד (Redis) שאסור שיקדמו ל-commit
+    """
+    sync_session = session.sync_session
+    loop = asyncio.get_running_loop()
+    done = False
+    
+    # ה-savepoints שעוטפים את השינויים עכשיו (מהפנימי לחיצוני)
+    enclosing = set()
+    if bind_to_savepoint:
+        transaction = sync_session.get_nested_transaction()
+        while transaction is not None and transaction.nested:
+            enclosing.add(transaction)
+            transaction = transaction.parent
+    
+    def _finish(callback) -> None:
+        nonlocal done
+        if done:
+            return
+        done = True
+        
+        if callback is not None:
+            task = loop.create_task(callback())
+            _transaction_hook_tasks.add(task)
+            task.add_done_callback(_transaction_hook_tasks.discard)
+        
+        # הסרה אחרי סיום ה-dispatch הנוכחי (לא בזמן מעבר על רשימת ה-listeners)
+        loop.call_soon(_remove_listeners)
+    
+    def _after_commit(_session) -> None:
+        if not _session.in_nested_transaction():
+            _finish(on_commit)
+    
+    def _after_soft_rollback(_session, previous_transaction) -> None:
+        if previous_transaction.parent is None or previous_transaction in enclosing:
+            _finish(on_rollback)
+    
+    def _remove_listeners() -> None:
+        event.remove(sync_session, "after_commit", _after_commit)
+        event.remove(sync_session, "after_soft_rollback", _after_soft_rollback)
+    
+    event.listen(sync_session, "after_commit", _after_commit)
+    event.listen(sync_session, "after_soft_rollback", _after_soft_rollback)
+
+
 async def init_database() -> None:
     """אתחול מסד הנתונים - לשימוש ב-startup"""
     await db_manager.initialize()
@@ -302,6 +372,43 @@ async def execute_in_transaction(func, *args, **kwargs):
             raise
 
 
+# === Keyset Pagination ===
+
+async def paginate(
+    session: AsyncSession,
+    stmt: Select,
+    key: Any,
+    size: int = 500
+) -> AsyncGenerator[list, None]:
+    """
+    מעבר על תוצאות שאילתה בחלקים (keyset pagination):
+    WHERE key > :last_key ORDER BY key LIMIT size
+    הזיכרון חסום בגודל חלק אחד, גם כשיש עשרות אלפי שורות.
+    key חייב להיות עמודה ייחודית - שנבחרה בשאילתה או של ה-entity הראשון בה
+    """
+    last_key = None
+    while True:
+        page_stmt = stmt.order_by(key).limit(size)
+        if last_key is not None:
+            page_stmt = page_stmt.where(key > last_key)
+        
+        result = await session.execute(page_stmt)
+        rows = result.all()
+        if not rows:
+            return
+        
+        yield rows
+        
+        if len(rows) < size:
+            return
+        
+        last_row = rows[-1]
+        if key in last_row._mapping:
+            last_key = last_row._mapping[key]
+        else:
+            last_key = getattr(last_row[0], key.key)
+
+
 # === Database Initialization Event ===
 
 async def ensure_database_initialized():
@@ -10,10 +10,10 @@ from decimal import Decimal
 
 from sqlalchemy import (
     String, Integer, BigInteger, Boolean, DateTime, Numeric, Text,
-    ForeignKey, Index, CheckConstraint, UniqueConstraint
+    ForeignKey, Index, CheckConstraint, UniqueConstraint, text
 )
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy.dialects.postgresql import UUID, ENUM, ARRAY
+from sqlalchemy.dialects.postgresql import UUID, ENUM, ARRAY, insert as pg_insert
 import uuid
 
 from app.database import Base
@@ -218,6 +218,12 @@ class Coupon(Base):
         Index("idx_coupons_location", "location_city"),
         Index("idx_coupons_search", "status", "category_id", "selling_price"),
         Index("idx_coupons_active", "status", "expires_at", "quantity"),
+        # קופונים פעילים לפי תפוגה - לניקוי ולהתראות של ה-scheduler
+        Index(
+            "idx_coupons_expiry_active",
+            "expires_at",
+            postgresql_where=text("status = 'ACTIVE'")
+        ),
         CheckConstraint("original_price > 0", name="chk_coupon_original_price"),
         CheckConstraint("selling_price > 0", name="chk_coupon_selling_price"),
         CheckConstraint("quantity >= 0", name="chk_coupon_quantity"),
@@ -432,25 +438,35 @@ def cleanup_expired_coupons():
 
 # === Category Management ===
 
-def initialize_default_categories():
-    """אתחול קטגוריות ברירת מחדל"""
+def default_category_rows() -> list[dict]:
+    """
+    שורות קטגוריות ברירת המחדל (ל-INSERT מרוכז).
+    חותמות הזמן נקבעות כאן - ל-created_at / updated_at יש רק default_factory
+    של ה-dataclass, ש-INSERT ב-Core לא מפעיל
+    """
     from app.config import COUPON_CATEGORIES
     
-    categories = []
-    for category_id, name_he in COUPON_CATEGORIES.items():
-        icon = name_he.split()[0]  # החלק הראשון הוא האימוג'י
-        name_clean = " ".join(name_he.split()[1:])  # השאר הוא השם
-        
-        category = CouponCategory(
-            id=category_id,
-            name_he=name_he,
-            name_en=category_id.replace("_", " ").title(),
-            icon_emoji=icon,
-            sort_order=list(COUPON_CATEGORIES.keys()).index(category_id)
-        )
-        categories.append(category)
-    
-    return categories
+    now = datetime.now(timezone.utc)
+    rows = []
+    for sort_order, (category_id, name_he) in enumerate(COUPON_CATEGORIES.items()):
+        rows.append({
+            "id": category_id,
+            "name_he": name_he,
+            "name_en": category_id.replace("_", " ").title(),
+            "icon_emoji": name_he.split()[0],  # החלק הראשון הוא האימוג'י
+            "sort_order": sort_order,
+            "created_at": now,
+            "updated_at": now,
+        })
+    
+    return rows
+
+
+def default_categories_insert(rows: Optional[list[dict]] = None):
+    """INSERT מרובה שורות לקטגוריות ברירת המחדל; ON CONFLICT DO NOTHING לקטגוריות קיימות"""
+    return pg_insert(CouponCategory).values(
+        rows if rows is not None else default_category_rows()
+    ).on_conflict_do_nothing(index_elements=[CouponCategory.id])
 
 
 # TODO: Advanced Features
@@ -10,7 +10,7 @@ from decimal import Decimal
 
 from sqlalchemy import (
     String, Integer, BigInteger, Boolean, DateTime, Numeric, Text,
-    ForeignKey, Index, CheckConstraint, UniqueConstraint
+    ForeignKey, Index, CheckConstraint, UniqueConstraint, text
 )
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from sqlalchemy.dialects.postgresql import UUID, ENUM
@@ -161,6 +161,18 @@ class Order(Base):
         Index("idx_orders_status_timers", "status", "dispute_window_until", "seller_hold_until"),
         
         Index("idx_orders_dispute", "status", "reported_at"),
+        
+        # אינדקסים חלקיים לשאילתות ה-scheduler
+        Index(
+            "idx_orders_dispute_window_open",
+            "dispute_window_until",
+            postgresql_where=text("status = 'DELIVERED' AND reported_at IS NULL")
+        ),
+        Index(
+            "idx_orders_hold_release_pending",
+            "seller_hold_until",
+            postgresql_where=text("status = 'DELIVERED' AND buyer_confirmed_at IS NULL")
+        ),
         Index("idx_orders_created", "created_at"),
         CheckConstraint("total_amount > 0", name="chk_order_amount_positive"),
         CheckConstraint("quantity > 0", name="chk_order_quantity_positive"),
@@ -286,6 +298,12 @@ class Auction(Base):
         Index("idx_auctions_ends_at", "ends_at"),
         Index("idx_auctions_extended", "extended_until"),
         Index("idx_auctions_active", "status", "ends_at"),
+        # זמן סיום אפקטיבי של מכרזים פעילים - לסריקה הדחופה של ה-scheduler
+        Index(
+            "idx_auctions_effective_end_active",
+            text("COALESCE(extended_until, ends_at)"),
+            postgresql_where=text("status = 'ACTIVE'")
+        ),
         CheckConstraint("starting_price > 0", name="chk_auction_starting_price"),
         CheckConstraint("current_price >= starting_price", name="chk_auction_current_price"),
         CheckConstraint("ends_at > starts_at", name="chk_auction_timing"),
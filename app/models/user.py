@@ -4,13 +4,14 @@
 """
 
 import enum
+from functools import lru_cache
 from datetime import datetime, timezone
 from typing import Optional
 from decimal import Decimal
 
 from sqlalchemy import (
     String, Integer, BigInteger, Boolean, DateTime, Numeric, Text,
-    ForeignKey, Index, CheckConstraint, UniqueConstraint
+    ForeignKey, Index, CheckConstraint, UniqueConstraint, text
 )
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from sqlalchemy.dialects.postgresql import UUID, ENUM, JSONB
@@ -343,6 +344,22 @@ class Transaction(Base):
         Index("idx_transactions_reference", "reference_type", "reference_id"),
         Index("idx_transactions_created", "created_at"),
         Index("idx_transactions_amount", "amount"),
+        # סכומים לפי סוג בארנק (סטטיסטיקות) - index-only scan בזכות INCLUDE
+        Index(
+            "idx_transactions_wallet_type",
+            "wallet_id",
+            "type",
+            postgresql_include=["amount"],
+        ),
+        # איתור ה-hold של הזמנה (שחרור למוכר / החזר)
+        Index(
+            "idx_transactions_hold_lookup",
+            "wallet_id",
+            "reference_id",
+            postgresql_where=text("type = 'HOLD_LOCK'"),
+        ),
+        # היסטוריית תנועות משתמש, מהחדשה לישנה
+        Index("idx_transactions_user_created", "user_id", text("created_at DESC")),
     )
     
     def __repr__(self) -> str:
@@ -401,6 +418,12 @@ class FundLock(Base):
         Index("idx_fund_locks_reference", "reference_type", "reference_id"),
         Index("idx_fund_locks_active", "is_active"),
         Index("idx_fund_locks_expires", "expires_at"),
+        # ניקוי נעילות שפגו - רק נעילות פעילות
+        Index(
+            "idx_fund_locks_expiry_active",
+            "expires_at",
+            postgresql_where=text("is_active"),
+        ),
         CheckConstraint("amount > 0", name="chk_lock_amount_positive"),
     )
     
@@ -431,6 +454,14 @@ def calculate_fees(amount: Decimal, is_buyer: bool = True, seller_verified: bool
     חישוב עמלות
     Returns: (עמלת קונה, עמלת מוכר)
     """
+    # ארגומנטים פוזיציונליים - רשומת cache אחת לאותם ערכים, בלי קשר לאופן הקריאה.
+    # Decimal משווה ומחשב hash לפי הערך המספרי, כך ש-10 ו-10.00 כבר חולקים רשומה
+    return _calculate_fees(amount, is_buyer, seller_verified)
+
+
+@lru_cache(maxsize=8192)
+def _calculate_fees(amount: Decimal, is_buyer: bool, seller_verified: bool) -> tuple[Decimal, Decimal]:
+    """חישוב העמלות בפועל - פונקציה טהורה של הסכום וההגדרות (שלא משתנות בזמן ריצה)"""
     from app.config import settings
     
     buyer_fee = Decimal('0.00')
@@ -7,25 +7,183 @@ import asyncio
 import logging
 from datetime import datetime, timezone, timedelta
 from typing import List, Dict, Optional
-from decimal import Decimal
 
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.jobstores.memory import MemoryJobStore
 from apscheduler.executors.asyncio import AsyncIOExecutor
+from cachetools import TTLCache
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_, or_, update
+from sqlalchemy import select, and_, update, func, cast, Integer, text, bindparam
+from sqlalchemy.orm import selectinload
 from telegram import Bot
-from telegram.error import TelegramError
 
-from app.database import db_manager
-from app.models.user import User, Wallet, Transaction, FundLock
+from app.database import db_manager, paginate
+from app.models.user import User, SellerProfile
 from app.models.order import Order, OrderStatus, Auction, AuctionStatus
 from app.models.coupon import Coupon, CouponStatus, UserFavorite
 from app.services.wallet_service import WalletService
-from app.config import settings, MESSAGES
+from app.services.telegram_dispatcher import TelegramDispatcher
+from app.config import settings
 
 logger = logging.getLogger(__name__)
 
+# מכרזים ו-holds מסתיימים ב-date job מדויק לכל אחד; הסריקה התקופתית היא רק רשת ביטחון
+# (למשל אחרי הפעלה מחדש, כשה-jobstore בזיכרון ריק)
+SWEEP_INTERVAL_MINUTES = 10
+
+# מספר מכרזים / holds מקסימלי שנתפסים (FOR UPDATE SKIP LOCKED) בכל סריקה
+AUCTION_BATCH_SIZE = 100
+
+# מספר מכרזים שמסתיימים במקביל (כל אחד ב-session משלו) - נשאר מתחת לגודל ה-pool
+AUCTION_FINALIZE_CONCURRENCY = 8
+
+# גודל חלק (keyset pagination) בסריקת מועדפים להתראות
+NOTIFICATION_PAGE_SIZE = 500
+
+# פיזור משימות: הפרש התחלה בין משימות + jitter אקראי לכל ריצה,
+# כדי שמשימות במרווחים שונים לא יפגעו ב-pool באותה שנייה
+JOB_STAGGER_SECONDS = 45
+JOB_JITTER_SECONDS = 30
+
+# מכרזים ו-holds שמגיע זמנם עד הסריקה הבאה (כולל ה-jitter שלה) מקבלים date job מדויק
+SCHEDULE_HORIZON = timedelta(minutes=SWEEP_INTERVAL_MINUTES, seconds=JOB_JITTER_SECONDS)
+
+# === Precompiled Statements ===
+# שאילתות ה-tick נבנות פעם אחת בטעינת המודול; ערכים משתנים עוברים כ-bindparam
+# ולכן אין בניית עץ ביטוי מחדש בכל ריצה (וה-SQL נשלף מה-compiled cache)
+
+_effective_end = func.coalesce(Auction.extended_until, Auction.ends_at)
+
+# SKIP LOCKED - כמה workers במקביל מקבלים אצוות זרות ולא מתחרים על אותן שורות
+AUCTION_DEADLINES_STMT = select(Auction, _effective_end.label('eff_end')).where(
+    and_(
+        Auction.status == AuctionStatus.ACTIVE,
+        _effective_end <= bindparam('soon')
+    )
+).order_by(_effective_end).limit(AUCTION_BATCH_SIZE).with_for_update(
+    skip_locked=True, of=Auction
+)
+
+ACTIVE_AUCTION_FOR_UPDATE_STMT = select(Auction).where(
+    and_(
+        Auction.id == bindparam('auction_id'),
+        Auction.status == AuctionStatus.ACTIVE
+    )
+).with_for_update(skip_locked=True)
+
+HELD_ORDER_FOR_UPDATE_STMT = select(Order).where(
+    and_(
+        Order.id == bindparam('order_id'),
+        Order.status == OrderStatus.DELIVERED,
+        Order.buyer_confirmed_at.is_(None)
+    )
+).with_for_update(skip_locked=True)
+
+UPCOMING_HOLDS_STMT = select(Order.id, Order.seller_hold_until).where(
+    and_(
+        Order.status == OrderStatus.DELIVERED,
+        Order.buyer_confirmed_at.is_(None),
+        Order.seller_hold_until > bindparam('now'),
+        Order.seller_hold_until <= bindparam('soon')
+    )
+)
+
+DISPUTE_WINDOWS_CLOSING_STMT = select(Order).where(
+    and_(
+        Order.status == OrderStatus.DELIVERED,
+        Order.dispute_window_until.isnot(None),
+        Order.dispute_window_until <= bindparam('soon'),
+        Order.dispute_window_until > bindparam('now'),
+        Order.reported_at.is_(None)  # עדיין לא דווח
+    )
+)
+
+PRICE_DROP_FAVORITES_STMT = select(UserFavorite).options(
+    selectinload(UserFavorite.coupon)
+).join(UserFavorite.coupon).where(
+    and_(
+        UserFavorite.notify_price_drop == True,
+        Coupon.status == CouponStatus.ACTIVE
+    )
+)
+
+# קופונים שפגים בשבוע הקרוב - לפי שעון המסד, כמו days_left
+EXPIRING_FAVORITES_STMT = select(
+    UserFavorite.id,
+    UserFavorite.user_id,
+    Coupon.title,
+    Coupon.expires_at,
+    cast(
+        func.extract('day', Coupon.expires_at - func.now()), Integer
+    ).label('days_left')
+).join(Coupon, UserFavorite.coupon_id == Coupon.id).where(
+    and_(
+        UserFavorite.notify_expiry.is_(True),
+        Coupon.status == CouponStatus.ACTIVE,
+        Coupon.expires_at.isnot(None),
+        Coupon.expires_at <= func.now() + timedelta(days=7)
+    )
+)
+
+EXPIRE_COUPONS_STMT = update(Coupon).where(
+    and_(
+        Coupon.status == CouponStatus.ACTIVE,
+        Coupon.expires_at.isnot(None),
+        Coupon.expires_at <= func.now()
+    )
+).values(status=CouponStatus.EXPIRED).returning(
+    Coupon.id, Coupon.seller_id, Coupon.title
+)
+
+RESET_SELLER_QUOTAS_STMT = update(SellerProfile).where(
+    SellerProfile.quota_reset_date < bindparam('today_start')
+).values(
+    daily_count=0,
+    quota_reset_date=bindparam('today_start')
+)
+
+CHAT_IDS_STMT = select(User.id, User.telegram_user_id).where(
+    User.id.in_(bindparam('user_ids', expanding=True))
+)
+
+SELLER_VERIFIED_STMT = select(SellerProfile.is_verified).where(
+    SellerProfile.user_id == bindparam('seller_id')
+)
+
+# מגבלת אורך הודעה בטלגרם (4096) עם מרווח לכותרת
+ADMIN_REPORT_MAX_CHARS = 4000
+
+
+class AdminReporter:
+    """
+    צבירת הודעות לאדמינים במהלך tick אחד, ושליחתן כהודעה מאוחדת אחת לכל אדמין
+    """
+    
+    def __init__(self):
+        self._lines: List[str] = []
+    
+    def add(self, message: str):
+        """הוספת שורה לדוח של ה-tick הנוכחי"""
+        self._lines.append(message)
+    
+    def __bool__(self) -> bool:
+        return bool(self._lines)
+    
+    def drain(self) -> List[str]:
+        """ריקון הדוח - מחזיר הודעות מאוחדות, כל אחת בגבולות אורך הודעה בטלגרם"""
+        chunks: List[str] = []
+        current = ""
+        for line in self._lines:
+            if current and len(current) + len(line) + 2 > ADMIN_REPORT_MAX_CHARS:
+                chunks.append(current)
+                current = ""
+            current = f"{current}\n\n{line}" if current else line
+        if current:
+            chunks.append(current)
+        
+        self._lines = []
+        return chunks
+
 
 class SchedulerService:
     """שירות משימות מתוזמנות"""
@@ -33,11 +191,19 @@ class SchedulerService:
     def __init__(self):
         self.scheduler: Optional[AsyncIOScheduler] = None
         self.bot: Optional[Bot] = None
+        self.dispatcher = TelegramDispatcher()
+        self.admin_reporter = AdminReporter()
         self._running = False
+        
+        # cache לסטטוס אימות מוכרים (seller_id -> is_verified), משתנה לעיתים רחוקות
+        self._seller_verified_cache: TTLCache = TTLCache(maxsize=1024, ttl=300)
     
     def setup_scheduler(self) -> AsyncIOScheduler:
-        """הגדרת APScheduler עם PostgreSQL jobstore"""
+        """הגדרת APScheduler עם jobstore בזיכרון"""
         
+        # jobstore בזיכרון ולא SQLAlchemyJobStore: כל המשימות הן מתודות של השירות
+        # שנרשמות מחדש בכל עלייה (replace_existing), כך שאין מה לשמור במסד -
+        # וגם אין INSERT/UPDATE לכל ריצה של משימה מול ה-DB
         jobstores = {
             'default': MemoryJobStore()
         }
@@ -46,10 +212,11 @@ class SchedulerService:
             'default': AsyncIOExecutor()
         }
         
+        # max_instances=1 - משימות DB לא רצות במקביל לעצמן כשהמסד איטי
         job_defaults = {
             'coalesce': False,
-            'max_instances': 3,
-            'misfire_grace_time': 30
+            'max_instances': 1,
+            'misfire_grace_time': 15
         }
         
         self.scheduler = AsyncIOScheduler(
@@ -67,6 +234,7 @@ class SchedulerService:
             return
         
         self.bot = telegram_bot
+        await self.dispatcher.start(telegram_bot)
         
         if not self.scheduler:
             self.setup_scheduler()
@@ -82,44 +250,44 @@ class SchedulerService:
         """עצירת השירות"""
         if self.scheduler and self._running:
             self.scheduler.shutdown(wait=False)
+            await self.dispatcher.stop()
             self._running = False
             logger.info("🔒 Scheduler service stopped")
     
     async def _add_scheduled_jobs(self):
         """הוספת כל המשימות המתוזמנות"""
         
-        # כל דקה - בדיקות דחופות
+        start = datetime.now(timezone.utc)
+        
+        # כל 10 דקות - בדיקות דחופות (רשת ביטחון לסיום מכרזים + תזמון date jobs)
         self.scheduler.add_job(
             self.check_urgent_tasks,
             'interval',
-            minutes=1,
+            minutes=SWEEP_INTERVAL_MINUTES,
+            jitter=JOB_JITTER_SECONDS,
+            next_run_time=start,
             id='urgent_tasks',
             replace_existing=True
         )
         
-        # כל 5 דקות - שחרור holds ומכרזים
+        # כל 10 דקות - שחרור holds שפוספסו + תזמון date jobs ל-holds הקרובים + ניקוי נעילות
         self.scheduler.add_job(
             self.release_expired_holds,
             'interval',
-            minutes=5,
+            minutes=SWEEP_INTERVAL_MINUTES,
+            jitter=JOB_JITTER_SECONDS,
+            next_run_time=start + timedelta(seconds=JOB_STAGGER_SECONDS),
             id='release_holds',
             replace_existing=True
         )
         
-        # כל 10 דקות - מכרזים ונעילות
-        self.scheduler.add_job(
-            self.finalize_ended_auctions,
-            'interval',
-            minutes=10,
-            id='finalize_auctions',
-            replace_existing=True
-        )
-        
         # כל 15 דקות - התראות
         self.scheduler.add_job(
             self.send_notifications,
             'interval',
             minutes=15,
+            jitter=JOB_JITTER_SECONDS,
+            next_run_time=start + timedelta(seconds=2 * JOB_STAGGER_SECONDS),
             id='notifications',
             replace_existing=True
         )
@@ -129,6 +297,8 @@ class SchedulerService:
             self.cleanup_tasks,
             'interval',
             hours=1,
+            jitter=JOB_JITTER_SECONDS,
+            next_run_time=start + timedelta(seconds=3 * JOB_STAGGER_SECONDS),
             id='cleanup',
             replace_existing=True
         )
@@ -145,101 +315,205 @@ class SchedulerService:
         
         logger.info("📅 Scheduled jobs added successfully")
     
+    # === Date Jobs (אירוע לכל מכרז / hold) ===
+    
+    def schedule_auction_finalization(self, auction_id: str, run_at: datetime):
+        """
+        תזמון סיום מכרז בדיוק בזמן הסיום שלו.
+        יש לקרוא ביצירת מכרז ובכל הארכה (replace_existing מחליף את הזמן הקודם)
+        """
+        if not self.scheduler:
+            return
+        
+        self.scheduler.add_job(
+            self._finalize_auction_by_id,
+            'date',
+            run_date=run_at,
+            args=[auction_id],
+            id=f'finalize:{auction_id}',
+            replace_existing=True
+        )
+    
+    def schedule_hold_release(self, order_id: str, run_at: datetime):
+        """תזמון שחרור hold למוכר בדיוק ב-seller_hold_until"""
+        if not self.scheduler:
+            return
+        
+        self.scheduler.add_job(
+            self._release_hold_by_id,
+            'date',
+            run_date=run_at,
+            args=[order_id],
+            id=f'release_hold:{order_id}',
+            replace_existing=True
+        )
+    
+    async def _finalize_auction_by_id(self, auction_id: str, now: Optional[datetime] = None):
+        """סיום מכרז בודד ב-session משלו (מופעל ע"י date job או ע"י הסריקה)"""
+        now = now or datetime.now(timezone.utc)
+        
+        try:
+            async with db_manager.get_session() as session:
+                result = await session.execute(
+                    ACTIVE_AUCTION_FOR_UPDATE_STMT, {'auction_id': auction_id}
+                )
+                auction = result.scalar_one_or_none()
+                
+                # כבר סוים (או נעול ע"י הסריקה)
+                if not auction:
+                    return
+                
+                # המכרז הוארך אחרי שה-job תוזמן - תזמון מחדש לזמן החדש
+                end_time = auction.extended_until or auction.ends_at
+                if end_time > now:
+                    self.schedule_auction_finalization(auction_id, end_time)
+                    return
+                
+                await self._finalize_auction(session, auction, now)
+                await session.commit()
+        
+        except Exception as e:
+            logger.error(f"❌ Auction {auction_id} finalization job failed: {e}")
+    
+    async def _release_hold_by_id(self, order_id: str):
+        """שחרור hold בודד (מופעל ע"י date job)"""
+        now = datetime.now(timezone.utc)
+        
+        try:
+            async with db_manager.get_session() as session:
+                result = await session.execute(
+                    HELD_ORDER_FOR_UPDATE_STMT, {'order_id': order_id}
+                )
+                order = result.scalar_one_or_none()
+                
+                if not order or not order.seller_hold_until:
+                    return
+                
+                if order.seller_hold_until > now:
+                    self.schedule_hold_release(order_id, order.seller_hold_until)
+                    return
+                
+                if await self._release_order_hold(session, WalletService(session), order):
+                    await session.commit()
+                    await self._notify_seller_payment_released(order)
+        
+        except Exception as e:
+            logger.error(f"❌ Hold release job for order {order_id} failed: {e}")
+    
     # === משימות דחופות (כל דקה) ===
     
     async def check_urgent_tasks(self):
         """בדיקות דחופות שצריכות לרוץ כל דקה"""
+        # זמן אחד לכל ה-tick - כל הבדיקות רואות את אותו "עכשיו"
+        now = datetime.now(timezone.utc)
+        
         try:
             async with db_manager.get_session() as session:
-                # בדיקת מכרזים שמסתיימים בדקות הקרובות
-                await self._check_ending_auctions_soon(session)
+                # מכרזים: סיום מכרזים שהסתיימו + התראה על מכרזים שמסתיימים בדקות הקרובות
+                await self._process_auction_deadlines(session, now)
                 
                 # בדיקת חלונות דיווח שנסגרים בקרוב  
-                await self._check_dispute_windows_closing(session)
+                await self._check_dispute_windows_closing(session, now)
         
         except Exception as e:
             logger.error(f"❌ Urgent tasks failed: {e}")
-    
-    async def _check_ending_auctions_soon(self, session: AsyncSession):
-        """בדיקת מכרזים שמסתיימים ב-10 דקות הקרובות"""
-        now = datetime.now(timezone.utc)
-        soon = now + timedelta(minutes=10)
         
-        stmt = select(Auction).where(
-            and_(
-                Auction.status == AuctionStatus.ACTIVE,
-                or_(
-                    and_(Auction.extended_until.is_(None), Auction.ends_at <= soon),
-                    and_(Auction.extended_until.isnot(None), Auction.extended_until <= soon)
-                )
-            )
-        )
+        finally:
+            await self._flush_admin_reports()
+    
+    async def _process_auction_deadlines(
+        self,
+        session: AsyncSession,
+        now: datetime,
+        horizon: timedelta = SCHEDULE_HORIZON
+    ):
+        """
+        סריקה אחת של מכרזים פעילים לפי זמן הסיום האפקטיבי (extended_until ?? ends_at):
+        מכרזים שהסתיימו - סיום, מכרזים שמסתיימים בתוך horizon - התראה ו-date job לסיום
+        """
+        result = await session.execute(AUCTION_DEADLINES_STMT, {'soon': now + horizon})
+        
+        ended_ids = []
+        for auction, eff_end in result.all():
+            if eff_end <= now:
+                ended_ids.append(auction.id)
+            else:
+                await self._notify_auction_ending_soon(auction)
+                self.schedule_auction_finalization(auction.id, eff_end)
+        
+        # שחרור נעילות הסריקה - כל סיום נועל מחדש את המכרז שלו (SKIP LOCKED)
+        await session.commit()
+        
+        await self._finalize_auctions_concurrently(ended_ids, now)
+    
+    async def _finalize_auctions_concurrently(self, auction_ids: List[str], now: datetime):
+        """סיום מכרזים בלתי תלויים במקביל, עד AUCTION_FINALIZE_CONCURRENCY בו-זמנית"""
+        if not auction_ids:
+            return
         
-        result = await session.execute(stmt)
-        ending_auctions = result.scalars().all()
+        semaphore = asyncio.Semaphore(AUCTION_FINALIZE_CONCURRENCY)
+        
+        async def finalize_one(auction_id: str):
+            async with semaphore:
+                await self._finalize_auction_by_id(auction_id, now)
         
-        for auction in ending_auctions:
-            await self._notify_auction_ending_soon(auction)
+        await asyncio.gather(
+            *[finalize_one(auction_id) for auction_id in auction_ids],
+            return_exceptions=True
+        )
     
-    async def _check_dispute_windows_closing(self, session: AsyncSession):
+    async def _check_dispute_windows_closing(self, session: AsyncSession, now: datetime):
         """בדיקת חלונות דיווח שנסגרים בשעתיים הקרובות"""
-        now = datetime.now(timezone.utc)
-        soon = now + timedelta(hours=2)
-        
-        stmt = select(Order).where(
-            and_(
-                Order.status == OrderStatus.DELIVERED,
-                Order.dispute_window_until.isnot(None),
-                Order.dispute_window_until <= soon,
-                Order.dispute_window_until > now,
-                Order.reported_at.is_(None)  # עדיין לא דווח
-            )
+        result = await session.execute(
+            DISPUTE_WINDOWS_CLOSING_STMT, {'now': now, 'soon': now + timedelta(hours=2)}
         )
-        
-        result = await session.execute(stmt)
         closing_windows = result.scalars().all()
         
         for order in closing_windows:
             await self._send_dispute_window_reminder(order)
     
-    # === שחרור Holds (כל 5 דקות) ===
+    # === שחרור Holds (כל 10 דקות) ===
     
     async def release_expired_holds(self):
-        """שחרור holds שהגיע זמנם"""
+        """שחרור holds שהגיע זמנם ותזמון date jobs ל-holds שמגיע זמנם עד הסריקה הבאה"""
+        now = datetime.now(timezone.utc)
+        
         try:
             async with db_manager.get_session() as session:
                 wallet_service = WalletService(session)
                 
-                # קבלת הזמנות שמוכנות לשחרור
-                orders_to_release = await wallet_service.get_orders_ready_for_release()
-                
                 released_count = 0
-                for order_id in orders_to_release:
-                    # קבלת פרטי ההזמנה
-                    stmt = select(Order).where(Order.id == order_id)
-                    result = await session.execute(stmt)
-                    order = result.scalar_one_or_none()
+                while True:
+                    # תפיסת אצווה של הזמנות שמוכנות לשחרור (שה-date job שלהן פוספס).
+                    # SKIP LOCKED - כל worker מקבל אצווה זרה; הנעילות מוחזקות עד ה-commit
+                    orders = await wallet_service.get_orders_ready_for_release(
+                        limit=AUCTION_BATCH_SIZE
+                    )
+                    if not orders:
+                        break
                     
-                    if order and order.status == OrderStatus.DELIVERED:
-                        # שחרור ה-hold למוכר
-                        success = await wallet_service.release_seller_hold(
-                            order_id=order_id,
-                            seller_id=order.seller_id,
-                            early_release=False
-                        )
-                        
-                        if success:
-                            # עדכון סטטוס ההזמנה
-                            order.status = OrderStatus.RELEASED
-                            await session.commit()
-                            
-                            # הודעה למוכר
-                            await self._notify_seller_payment_released(order)
-                            released_count += 1
+                    released_orders = []
+                    for order in orders:
+                        if await self._release_order_hold(session, wallet_service, order):
+                            released_orders.append(order)
+                    
+                    # commit אחד לכל אצווה - משחרר את נעילות השורות
+                    await session.commit()
+                    
+                    # הודעות למוכרים
+                    for order in released_orders:
+                        await self._notify_seller_payment_released(order)
+                    released_count += len(released_orders)
+                    
+                    # אצווה חלקית, או אצווה שאף הזמנה בה לא שוחררה (אחרת נתפוס אותה שוב)
+                    if len(orders) < AUCTION_BATCH_SIZE or not released_orders:
+                        break
                 
                 if released_count > 0:
                     logger.info(f"✅ Released {released_count} seller holds")
                 
+                await self._schedule_upcoming_hold_releases(session, now)
+                
                 # ניקוי נעילות שפגו
                 expired_cleaned = await wallet_service.cleanup_expired_locks()
                 if expired_cleaned > 0:
@@ -247,152 +521,194 @@ class SchedulerService:
         
         except Exception as e:
             logger.error(f"❌ Hold release failed: {e}")
+        
+        finally:
+            await self._flush_admin_reports()
+    
+    async def _schedule_upcoming_hold_releases(
+        self,
+        session: AsyncSession,
+        now: datetime,
+        horizon: timedelta = SCHEDULE_HORIZON
+    ):
+        """
+        date job לכל hold שמגיע זמנו בתוך horizon - השחרור קורה ב-seller_hold_until
+        ולא בסריקה שאחריו (replace_existing - תזמון חוזר של אותה הזמנה לא מכפיל jobs)
+        """
+        result = await session.execute(UPCOMING_HOLDS_STMT, {'now': now, 'soon': now + horizon})
+        
+        for order_id, hold_until in result.all():
+            self.schedule_hold_release(order_id, hold_until)
+    
+    async def _release_order_hold(
+        self,
+        session: AsyncSession,
+        wallet_service: WalletService,
+        order: Order
+    ) -> bool:
+        """
+        שחרור ה-hold של הזמנה למוכר ועדכון סטטוס, בתוך savepoint.
+        ה-commit וההודעה למוכר באחריות הקורא
+        """
+        order_id = order.id
+        
+        try:
+            async with session.begin_nested():
+                success = await wallet_service.release_seller_hold(
+                    order_id=order_id,
+                    seller_id=order.seller_id,
+                    early_release=False
+                )
+                
+                if not success:
+                    return False
+                
+                # עדכון סטטוס ההזמנה
+                order.status = OrderStatus.RELEASED
+        
+        except Exception as e:
+            logger.error(f"❌ Failed to release hold for order {order_id}: {e}")
+            return False
+        
+        return True
     
-    # === סיום מכרזים (כל 10 דקות) ===
+    # === סיום מכרזים (חלק מהבדיקות הדחופות) ===
     
     async def finalize_ended_auctions(self):
-        """סיום מכרזים שהסתיימו"""
+        """סיום מכרזים שהסתיימו (ללא התראות "מסתיים בקרוב")"""
+        now = datetime.now(timezone.utc)
+        
         try:
             async with db_manager.get_session() as session:
-                now = datetime.now(timezone.utc)
-                
-                # קבלת מכרזים שהסתיימו אבל עדיין לא סופיים
-                stmt = select(Auction).where(
-                    and_(
-                        Auction.status == AuctionStatus.ACTIVE,
-                        or_(
-                            and_(Auction.extended_until.is_(None), Auction.ends_at <= now),
-                            and_(Auction.extended_until.isnot(None), Auction.extended_until <= now)
-                        )
-                    )
-                )
-                
-                result = await session.execute(stmt)
-                ended_auctions = result.scalars().all()
-                
-                for auction in ended_auctions:
-                    await self._finalize_auction(session, auction)
+                await self._process_auction_deadlines(session, now, horizon=timedelta(0))
         
         except Exception as e:
             logger.error(f"❌ Auction finalization failed: {e}")
+        
+        finally:
+            await self._flush_admin_reports()
     
-    async def _finalize_auction(self, session: AsyncSession, auction: Auction):
-        """סיום מכרז בודד"""
+    async def _finalize_auction(self, session: AsyncSession, auction: Auction, now: datetime):
+        """
+        סיום מכרז בודד בתוך savepoint - כשל מבטל רק את העבודה של המכרז.
+        ה-commit באחריות הקורא (_finalize_auction_by_id)
+        """
+        auction_id = auction.id
+        has_winner = False
+        
         try:
-            # עדכון סטטוס לסיום
-            auction.status = AuctionStatus.ENDED
-            
-            # אם יש זוכה
-            if auction.winner_id and auction.winning_bid_id:
-                wallet_service = WalletService(session)
-                
-                # יצירת הזמנה מהמכרז
-                from app.models.order import create_auction_order
-                from app.models.coupon import Coupon
-                
-                # קבלת פרטי הקופון
-                stmt = select(Coupon).where(Coupon.id == auction.coupon_id)
-                result = await session.execute(stmt)
-                coupon = result.scalar_one()
+            async with session.begin_nested():
+                # עדכון סטטוס לסיום
+                auction.status = AuctionStatus.ENDED
                 
-                if coupon:
-                    # חיוב הזוכה ויצירת הזמנה
-                    seller_verified = await self._is_seller_verified(session, auction.seller_id)
+                # אם יש זוכה
+                if auction.winner_id and auction.winning_bid_id:
+                    wallet_service = WalletService(session)
                     
-                    buyer_tx, seller_tx = await wallet_service.finalize_auction(
-                        auction_id=auction.id,
-                        winner_id=auction.winner_id,
-                        winning_amount=auction.current_price,
-                        seller_id=auction.seller_id,
-                        seller_verified=seller_verified
-                    )
-                    
-                    # עדכון סטטוס למכרז כסופי
-                    auction.status = AuctionStatus.FINALIZED
-                    auction.finalized_at = datetime.now(timezone.utc)
+                    # יצירת הזמנה מהמכרז
+                    from app.models.order import create_auction_order
+                    from app.models.coupon import Coupon
                     
-                    # הודעות למשתתפים
-                    await self._notify_auction_winner(auction)
-                    await self._notify_auction_losers(auction)
+                    # קבלת פרטי הקופון
+                    stmt = select(Coupon).where(Coupon.id == auction.coupon_id)
+                    result = await session.execute(stmt)
+                    coupon = result.scalar_one()
                     
-                    logger.info(f"✅ Auction {auction.id} finalized, winner: {auction.winner_id}")
-            
-            await session.commit()
-            
+                    if coupon:
+                        # חיוב הזוכה ויצירת הזמנה
+                        seller_verified = await self._is_seller_verified(session, auction.seller_id)
+                        
+                        buyer_tx, seller_tx = await wallet_service.finalize_auction(
+                            auction_id=auction.id,
+                            winner_id=auction.winner_id,
+                            winning_amount=auction.current_price,
+                            seller_id=auction.seller_id,
+                            seller_verified=seller_verified
+                        )
+                        
+                        # עדכון סטטוס למכרז כסופי
+                        auction.status = AuctionStatus.FINALIZED
+                        auction.finalized_at = now
+                        has_winner = True
+        
         except Exception as e:
-            logger.error(f"❌ Failed to finalize auction {auction.id}: {e}")
-            await session.rollback()
+            logger.error(f"❌ Failed to finalize auction {auction_id}: {e}")
+            return
+        
+        if has_winner:
+            # הודעות למשתתפים
+            await self._notify_auction_winner(auction)
+            await self._notify_auction_losers(auction)
+            
+            logger.info(f"✅ Auction {auction_id} finalized, winner: {auction.winner_id}")
     
     # === התראות (כל 15 דקות) ===
     
     async def send_notifications(self):
         """שליחת התראות למשתמשים"""
+        now = datetime.now(timezone.utc)
+        
         try:
             async with db_manager.get_session() as session:
-                await self._send_price_drop_notifications(session)
+                await self._send_price_drop_notifications(session, now)
                 await self._send_expiry_notifications(session)
                 await self._send_favorite_notifications(session)
         
         except Exception as e:
             logger.error(f"❌ Notifications failed: {e}")
+        
+        finally:
+            await self._flush_admin_reports()
     
-    async def _send_price_drop_notifications(self, session: AsyncSession):
+    async def _send_price_drop_notifications(self, session: AsyncSession, now: datetime):
         """התראות על ירידת מחיר"""
         # קבלת מועדפים שראוי לשלוח עליהם התראה
-        stmt = select(UserFavorite).join(Coupon).where(
-            and_(
-                UserFavorite.notify_price_drop == True,
-                Coupon.status == CouponStatus.ACTIVE
-            )
-        )
-        
-        result = await session.execute(stmt)
-        favorites = result.scalars().all()
-        
         sent_count = 0
-        for favorite in favorites:
-            if favorite.should_notify_price_drop(
-                favorite.coupon.selling_price, 
-                settings.PRICE_DROP_THRESHOLD_PERCENT
-            ):
-                await self._send_telegram_notification(
-                    user_id=favorite.user_id,
-                    message=f"💸 ירד מחיר! {favorite.coupon.title}\nמחיר חדש: {favorite.coupon.selling_price}₪"
-                )
-                
-                # עדכון שנשלחה התראה
-                favorite.price_alerts_sent += 1
-                favorite.last_price_check = datetime.now(timezone.utc)
-                sent_count += 1
+        async for rows in paginate(session, PRICE_DROP_FAVORITES_STMT, key=UserFavorite.id, size=NOTIFICATION_PAGE_SIZE):
+            favorites = [row[0] for row in rows]
+            
+            # שליפת כל ה-chat_id של החלק בשאילתה אחת במקום שאילתה לכל נמען
+            chat_ids = await self._resolve_chat_ids(
+                session, [favorite.user_id for favorite in favorites]
+            )
+            
+            page_sent = 0
+            for favorite in favorites:
+                if favorite.should_notify_price_drop(
+                    favorite.coupon.selling_price, 
+                    settings.PRICE_DROP_THRESHOLD_PERCENT
+                ):
+                    await self._send_to_chat(
+                        chat_id=chat_ids.get(favorite.user_id),
+                        message=f"💸 ירד מחיר! {favorite.coupon.title}\nמחיר חדש: {favorite.coupon.selling_price}₪"
+                    )
+                    
+                    # עדכון שנשלחה התראה
+                    favorite.price_alerts_sent += 1
+                    favorite.last_price_check = now
+                    page_sent += 1
+            
+            # טרנזקציה קטנה לכל חלק - התקדמות נשמרת גם אם חלק מאוחר נכשל
+            if page_sent > 0:
+                await session.commit()
+                sent_count += page_sent
         
         if sent_count > 0:
-            await session.commit()
             logger.info(f"📢 Sent {sent_count} price drop notifications")
     
     async def _send_expiry_notifications(self, session: AsyncSession):
         """התראות על קופונים שפגים בקרוב"""
-        # קופונים שפגים בשבוע הקרוב
-        soon = datetime.now(timezone.utc) + timedelta(days=7)
-        
-        stmt = select(UserFavorite).join(Coupon).where(
-            and_(
-                UserFavorite.notify_expiry == True,
-                Coupon.status == CouponStatus.ACTIVE,
-                Coupon.expires_at.isnot(None),
-                Coupon.expires_at <= soon
+        # שליפת העמודות הדרושות בלבד (ללא ORM), כולל ימים שנותרו שמחושבים במסד
+        async for rows in paginate(session, EXPIRING_FAVORITES_STMT, key=UserFavorite.id, size=NOTIFICATION_PAGE_SIZE):
+            chat_ids = await self._resolve_chat_ids(
+                session, [row.user_id for row in rows]
             )
-        )
-        
-        result = await session.execute(stmt)
-        expiring_favorites = result.scalars().all()
-        
-        for favorite in expiring_favorites:
-            days_left = (favorite.coupon.expires_at - datetime.now(timezone.utc)).days
             
-            await self._send_telegram_notification(
-                user_id=favorite.user_id,
-                message=f"⏰ קופון פג בקרוב!\n{favorite.coupon.title}\nנותרו {days_left} ימים"
-            )
+            for row in rows:
+                await self._send_to_chat(
+                    chat_id=chat_ids.get(row.user_id),
+                    message=f"⏰ קופון פג בקרוב!\n{row.title}\nנותרו {row.days_left} ימים"
+                )
 
     async def _send_favorite_notifications(self, session: AsyncSession):
         """התראות כלליות על מועדפים (placeholder)"""
@@ -404,73 +720,79 @@ class SchedulerService:
     
     async def cleanup_tasks(self):
         """משימות ניקוי ותחזוקה"""
+        now = datetime.now(timezone.utc)
+        
         try:
             async with db_manager.get_session() as session:
                 await self._cleanup_expired_coupons(session)
-                await self._update_seller_daily_quotas(session)
+                await self._update_seller_daily_quotas(session, now)
                 await self._cleanup_old_transactions(session)
         
         except Exception as e:
             logger.error(f"❌ Cleanup tasks failed: {e}")
+        
+        finally:
+            await self._flush_admin_reports()
     
     async def _cleanup_expired_coupons(self, session: AsyncSession):
         """עדכון קופונים שפגו"""
-        now = datetime.now(timezone.utc)
+        # עדכון אידמפוטנטי - אם יאבד בקריסה, הריצה הבאה תסמן שוב
+        await self._relax_commit_durability(session)
         
-        stmt = update(Coupon).where(
-            and_(
-                Coupon.status == CouponStatus.ACTIVE,
-                Coupon.expires_at.isnot(None),
-                Coupon.expires_at <= now
-            )
-        ).values(status=CouponStatus.EXPIRED)
-        
-        result = await session.execute(stmt)
-        expired_count = result.rowcount
+        # RETURNING - אותו round-trip מחזיר גם את הקופונים שעודכנו
+        result = await session.execute(EXPIRE_COUPONS_STMT)
+        expired_rows = result.all()
         
-        if expired_count > 0:
+        if expired_rows:
             await session.commit()
-            logger.info(f"🗑️ Marked {expired_count} coupons as expired")
+            logger.info(f"🗑️ Marked {len(expired_rows)} coupons as expired")
+            
+            await self._notify_sellers_coupons_expired(session, expired_rows)
     
-    async def _update_seller_daily_quotas(self, session: AsyncSession):
+    async def _update_seller_daily_quotas(self, session: AsyncSession, now: datetime):
         """איפוס מונים יומיים של מוכרים"""
-        from app.models.user import SellerProfile
-        
-        now = datetime.now(timezone.utc)
         today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
         
-        # איפוס מוכרים שהיום שלהם התחדש
-        stmt = update(SellerProfile).where(
-            SellerProfile.quota_reset_date < today_start
-        ).values(
-            daily_count=0,
-            quota_reset_date=today_start
-        )
+        await self._relax_commit_durability(session)
         
-        result = await session.execute(stmt)
+        # איפוס מוכרים שהיום שלהם התחדש
+        result = await session.execute(RESET_SELLER_QUOTAS_STMT, {'today_start': today_start})
         reset_count = result.rowcount
         
         if reset_count > 0:
             await session.commit()
             logger.info(f"🔄 Reset daily quota for {reset_count} sellers")
     
+    async def _relax_commit_durability(self, session: AsyncSession):
+        """
+        ביטול המתנה ל-fsync של ה-WAL לטרנזקציה הנוכחית בלבד (SET LOCAL).
+        רק לעדכוני תחזוקה אידמפוטנטיים - לא לארנקים או לסיום מכרזים.
+        חייב להיות SET LOCAL: ה-pool לא מאפס חיבורים בהחזרה (pool_reset_on_return=None)
+        """
+        await session.execute(text("SET LOCAL synchronous_commit = off"))
+    
     # === משימות יומיות ===
     
     async def daily_tasks(self):
         """משימות שרצות פעם ביום"""
+        now = datetime.now(timezone.utc)
+        
         try:
             async with db_manager.get_session() as session:
-                await self._generate_daily_reports(session)
+                await self._generate_daily_reports(session, now)
                 await self._cleanup_old_data(session)
                 await self._backup_important_data(session)
         
         except Exception as e:
             logger.error(f"❌ Daily tasks failed: {e}")
+        
+        finally:
+            await self._flush_admin_reports()
     
-    async def _generate_daily_reports(self, session: AsyncSession):
+    async def _generate_daily_reports(self, session: AsyncSession, now: datetime):
         """יצירת דוחות יומיים"""
         # TODO: יצירת דוחות למערכת ואדמינים
-        yesterday = datetime.now(timezone.utc) - timedelta(days=1)
+        yesterday = now - timedelta(days=1)
         
         # ספירת עסקאות יום קודם
         stmt = select(Order).where(
@@ -484,56 +806,73 @@ class SchedulerService:
         daily_orders = len(list(result.scalars().all()))
         
         if settings.LOG_CHANNEL_ID and daily_orders > 0:
-            await self._send_admin_notification(
-                f"📊 דוח יומי\nעסקאות אתמול: {daily_orders}"
-            )
+            self.admin_reporter.add(f"📊 דוח יומי\nעסקאות אתמול: {daily_orders}")
     
     # === Helper Functions ===
     
+    async def _resolve_chat_ids(self, session: AsyncSession, user_ids: List[int]) -> Dict[int, int]:
+        """מיפוי user_id -> telegram_user_id לכל הנמענים בשאילתה אחת"""
+        unique_ids = set(user_ids)
+        if not unique_ids:
+            return {}
+        
+        result = await session.execute(CHAT_IDS_STMT, {'user_ids': list(unique_ids)})
+        return dict(result.tuples().all())
+    
+    async def _send_to_chat(self, chat_id: Optional[int], message: str):
+        """הכנסת הודעה ל-chat_id שכבר ידוע לתור השליחה (ללא פנייה למסד או לרשת)"""
+        if not self.bot or not chat_id:
+            return
+        
+        await self.dispatcher.enqueue(chat_id, message)
+    
     async def _send_telegram_notification(self, user_id: int, message: str):
-        """שליחת התראה לטלגרם"""
+        """שליחת התראה לטלגרם לפי user_id (לנמען בודד)"""
         if not self.bot:
             return
         
-        try:
-            # קבלת telegram_user_id
-            async with db_manager.get_session() as session:
-                stmt = select(User.telegram_user_id).where(User.id == user_id)
-                result = await session.execute(stmt)
-                telegram_user_id = result.scalar_one_or_none()
-                
-                if telegram_user_id:
-                    await self.bot.send_message(
-                        chat_id=telegram_user_id,
-                        text=message
-                    )
+        # קבלת telegram_user_id
+        async with db_manager.get_session() as session:
+            chat_ids = await self._resolve_chat_ids(session, [user_id])
         
-        except TelegramError as e:
-            logger.warning(f"Failed to send notification to user {user_id}: {e}")
+        await self._send_to_chat(chat_ids.get(user_id), message)
     
     async def _send_admin_notification(self, message: str):
-        """שליחת התראה לאדמינים"""
+        """שליחת התראה לאדמינים - לכל האדמינים במקביל"""
         if not self.bot or not settings.ADMIN_CHAT_IDS:
             return
         
-        for admin_chat_id in settings.ADMIN_CHAT_IDS:
-            try:
-                await self.bot.send_message(
-                    chat_id=admin_chat_id,
-                    text=f"🔔 {message}"
-                )
-            except TelegramError as e:
-                logger.warning(f"Failed to send admin notification: {e}")
+        await asyncio.gather(
+            *[
+                self.dispatcher.enqueue(admin_chat_id, f"🔔 {message}")
+                for admin_chat_id in settings.ADMIN_CHAT_IDS
+            ],
+            return_exceptions=True
+        )
+    
+    async def _flush_admin_reports(self):
+        """שליחת כל מה שנצבר ב-tick כהודעה אחת לכל אדמין (נקרא בסוף כל משימה)"""
+        if not self.admin_reporter:
+            return
+        
+        for report in self.admin_reporter.drain():
+            await self._send_admin_notification(report)
     
     async def _is_seller_verified(self, session: AsyncSession, seller_id: int) -> bool:
-        """בדיקה האם מוכר מאומת"""
-        from app.models.user import SellerProfile
+        """בדיקה האם מוכר מאומת (עם cache של 5 דקות)"""
+        cached = self._seller_verified_cache.get(seller_id)
+        if cached is not None:
+            return cached
         
-        stmt = select(SellerProfile.is_verified).where(
-            SellerProfile.user_id == seller_id
-        )
-        result = await session.execute(stmt)
-        return result.scalar_one_or_none() or False
+        result = await session.execute(SELLER_VERIFIED_STMT, {'seller_id': seller_id})
+        is_verified = result.scalar_one_or_none() or False
+        
+        self._seller_verified_cache[seller_id] = is_verified
+        return is_verified
+    
+    def invalidate_seller(self, seller_id: int) -> None:
+        """ניקוי סטטוס האימות של מוכר מה-cache (לקריאה אחרי שינוי אימות בפאנל האדמין)"""
+        self._seller_verified_cache.pop(seller_id, None)
     
     async def _notify_auction_ending_soon(self, auction: Auction):
         """התראה על מכרז שמסתיים בקרוב"""
@@ -570,6 +909,21 @@ class SchedulerService:
         
         await self._send_telegram_notification(auction.winner_id, message)
     
+    async def _notify_sellers_coupons_expired(self, session: AsyncSession, expired_rows):
+        """הודעה מרוכזת לכל מוכר על הקופונים שלו שפגו (שורות מ-RETURNING)"""
+        titles_by_seller: Dict[int, List[str]] = {}
+        for _coupon_id, seller_id, title in expired_rows:
+            titles_by_seller.setdefault(seller_id, []).append(title)
+        
+        chat_ids = await self._resolve_chat_ids(session, list(titles_by_seller))
+        
+        for seller_id, titles in titles_by_seller.items():
+            message = (
+                f"🗓️ {len(titles)} קופונים שלך פגו תוקף והוסרו מהמכירה:\n"
+                + "\n".join(f"• {title}" for title in titles)
+            )
+            await self._send_to_chat(chat_ids.get(seller_id), message)
+    
     async def _notify_auction_losers(self, auction: Auction):
         """הודעה למפסידים במכרז"""
         # TODO: שליחת הודעות לכל המפסידים
@@ -0,0 +1,166 @@
+"""
+מפתחות idempotency - Idempotency Keys
+הגנה מפני חיוב כפול כשאותה פעולה כספית נשלחת שוב (retry של רשת / לחיצה כפולה)
+"""
+
+import functools
+import inspect
+import json
+import logging
+from typing import Any, Dict, List, Optional
+
+from app.database import run_after_transaction
+from app.models.user import Transaction, FundLock
+
+logger = logging.getLogger(__name__)
+
+# חלון ה-retry העסקי: תוצאה שמורה שעה; מפתח "pending" פג מהר יותר כדי
+# שקריסה באמצע פעולה לא תחסום ניסיונות חוזרים לאורך כל החלון
+IDEMPOTENCY_RESULT_TTL_SECONDS = 3600
+IDEMPOTENCY_PENDING_TTL_SECONDS = 60
+
+_PENDING = "pending"
+
+# ישויות שמותר להחזיר מפעולה idempotent (נשמרות כהפניה לשורה במסד)
+_ENTITIES = {model.__name__: model for model in (Transaction, FundLock)}
+
+
+class OperationInProgressError(Exception):
+    """פעולה עם אותו מפתח idempotency עדיין רצה"""
+    pass
+
+
+class IdempotencyStore:
+    """
+    מפתחות idempotency ב-Redis.
+    SET NX תופס את המפתח לפני השינוי במסד; אחרי commit נשמרת התוצאה לשימוש חוזר
+    """
+
+    def __init__(self, redis_client):
+        self.redis = redis_client
+
+    @staticmethod
+    def _key(scope: str, key: str) -> str:
+        return f"idempotency:{scope}:{key}"
+
+    async def try_acquire(self, scope: str, key: str) -> bool:
+        """תפיסת המפתח - False אם כבר קיים (רץ כעת או הסתיים)"""
+        return bool(await self.redis.set(
+            self._key(scope, key), _PENDING, nx=True, ex=IDEMPOTENCY_PENDING_TTL_SECONDS
+        ))
+
+    async def store_result(self, scope: str, key: str, payload: Dict[str, Any]) -> None:
+        """שמירת תוצאת הפעולה לחלון ה-retry"""
+        await self.redis.set(
+            self._key(scope, key), json.dumps(payload), ex=IDEMPOTENCY_RESULT_TTL_SECONDS
+        )
+
+    async def fetch_result(self, scope: str, key: str) -> Optional[Dict[str, Any]]:
+        """התוצאה השמורה, או None אם אין מפתח / הפעולה עדיין רצה"""
+        raw = await self.redis.get(self._key(scope, key))
+        if raw is None or raw == _PENDING:
+            return None
+        return json.loads(raw)
+
+    async def release(self, scope: str, key: str) -> None:
+        """שחרור המפתח (הפעולה נכשלה או שהתוצאה השמורה לא תקפה)"""
+        await self.redis.delete(self._key(scope, key))
+
+
+def _encode_entity(entity) -> Optional[List]:
+    return None if entity is None else [type(entity).__name__, entity.id]
+
+
+def _encode_result(result) -> Dict[str, Any]:
+    """
+    התוצאה נשמרת כהפניות (סוג + מזהה) ולא כערכים - ב-replay השורות נטענות
+    מהמסד, כך שהקורא מקבל ישויות אמיתיות
+    """
+    if isinstance(result, tuple):
+        return {"items": [_encode_entity(item) for item in result]}
+    return {"item": _encode_entity(result)}
+
+
+async def _decode_result(session, payload: Dict[str, Any]):
+    """טעינת התוצאה השמורה; מחזיר (True, תוצאה) או (False, None) אם שורה לא נראית"""
+    refs = payload["items"] if "items" in payload else [payload["item"]]
+
+    loaded = []
+    for ref in refs:
+        if ref is None:
+            loaded.append(None)
+            continue
+        entity = await session.get(_ENTITIES[ref[0]], ref[1])
+        if entity is None:
+            return False, None
+        loaded.append(entity)
+
+    return True, tuple(loaded) if "items" in payload else loaded[0]
+
+
+def idempotent(scope: str, key_arg: str):
+    """
+    דקורטור למתודות WalletService שמחזירות Transaction / FundLock (או tuple שלהם).
+    המפתח נלקח מהארגומנט key_arg; ללא Redis או ללא מפתח - הפעולה רצה כרגיל
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        async def wrapper(self, *args, **kwargs):
+            key = signature.bind(self, *args, **kwargs).arguments.get(key_arg)
+            if self.redis is None or key is None:
+                return await func(self, *args, **kwargs)
+
+            store = IdempotencyStore(self.redis)
+            try:
+                acquired = await store.try_acquire(scope, key)
+            except Exception as e:
+                logger.warning("Idempotency check failed for %s:%s: %s", scope, key, e)
+                return await func(self, *args, **kwargs)
+
+            if not acquired:
+                payload = await store.fetch_result(scope, key)
+                if payload is not None:
+                    found, result = await _decode_result(self.session, payload)
+                    if found:
+                        logger.info("Idempotent replay: %s:%s", scope, key)
+                        return result
+                    # התוצאה נשמרת רק אחרי commit - אם השורות לא נראות עדיין, לא מריצים שוב
+                    raise OperationInProgressError(f"Operation {scope}:{key} result is not visible yet")
+
+                # המפתח פג בין הבדיקות - ניסיון תפיסה נוסף
+                if not await store.try_acquire(scope, key):
+                    raise OperationInProgressError(f"Operation {scope}:{key} is already in progress")
+
+            try:
+                result = await func(self, *args, **kwargs)
+            except BaseException:
+                await store.release(scope, key)
+                raise
+
+            # המפתח נשאר "pending" עד סוף הטרנזקציה של הקורא: התוצאה נשמרת רק
+            # אחרי commit, וב-rollback המפתח משתחרר לניסיון חוזר - גם rollback של
+            # savepoint שעוטף את הקריאה (למשל סיום מכרז ב-begin_nested), שאחריו
+            # השורות לא ייכנסו ל-commit החיצוני
+            payload = _encode_result(result)
+
+            async def _store_after_commit() -> None:
+                try:
+                    await store.store_result(scope, key, payload)
+                except Exception as e:
+                    logger.warning("Failed to store idempotent result for %s:%s: %s", scope, key, e)
+
+            async def _release_after_rollback() -> None:
+                try:
+                    await store.release(scope, key)
+                except Exception as e:
+                    logger.warning("Failed to release idempotency key %s:%s: %s", scope, key, e)
+
+            run_after_transaction(
+                self.session, _store_after_commit, _release_after_rollback, bind_to_savepoint=True
+            )
+            return result
+
+        return wrapper
+    return decorator
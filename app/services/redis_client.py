@@ -0,0 +1,40 @@
+"""
+לקוח Redis משותף - Redis Client
+חיבור יחיד (lazy) לשירותים שמשתמשים ב-Redis כ-cache; אופציונלי לחלוטין
+"""
+
+import logging
+from typing import Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+_redis_client = None
+
+
+def get_redis_client():
+    """
+    קבלת לקוח Redis משותף, או None אם REDIS_URL לא מוגדר.
+    הייבוא של redis נעשה רק כשיש צורך, כך שהחבילה לא נדרשת בלי Redis
+    """
+    global _redis_client
+
+    if not settings.REDIS_URL:
+        return None
+
+    if _redis_client is None:
+        import redis.asyncio as aioredis
+        _redis_client = aioredis.from_url(settings.REDIS_URL, decode_responses=True)
+        logger.info("✅ Redis cache client created")
+
+    return _redis_client
+
+
+async def close_redis_client() -> None:
+    """סגירת הלקוח המשותף (בכיבוי האפליקציה)"""
+    global _redis_client
+
+    if _redis_client is not None:
+        await _redis_client.aclose()
+        _redis_client = None
@@ -0,0 +1,148 @@
+"""
+תור שליחה לטלגרם - Telegram Dispatcher
+שליחת הודעות ברקע עם הגבלת קצב (token bucket) וכיבוד retry_after של טלגרם
+"""
+
+import asyncio
+import json
+import logging
+from datetime import timedelta
+from typing import Optional, List, Tuple
+
+from aiolimiter import AsyncLimiter
+from telegram import Bot
+from telegram.error import RetryAfter, TelegramError
+
+from app.config import settings
+from app.services.redis_client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+# מפתח רשימת ההודעות ב-Redis (LPUSH / BRPOP)
+REDIS_QUEUE_KEY = "telegram:outbox"
+
+# המתנה אחרי כשל בקריאה מהתור (Redis לא זמין / הודעה פגומה) לפני ניסיון נוסף
+FETCH_ERROR_BACKOFF_SECONDS = 1.0
+
+
+class TelegramDispatcher:
+    """
+    תור הודעות יוצאות לטלגרם.
+    המשימות המתוזמנות רק מכניסות לתור וחוזרות מיד; workers ברקע שולחים
+    בקצב שלא עובר את מגבלת טלגרם (~30 הודעות לשנייה).
+    אם מוגדר REDIS_URL - התור נשמר ב-Redis ושורד הפעלה מחדש
+    (דרך הלקוח המשותף, שנסגר ב-close_redis_client).
+    """
+
+    def __init__(
+        self,
+        rate_per_second: int = settings.TELEGRAM_SEND_RATE_PER_SECOND,
+        concurrency: int = settings.TELEGRAM_DISPATCH_WORKERS,
+        redis_client=None
+    ):
+        self.bot: Optional[Bot] = None
+        self._limiter = AsyncLimiter(rate_per_second, 1)
+        self._concurrency = concurrency
+        # None - הלקוח המשותף של האפליקציה (או תור בזיכרון אם אין REDIS_URL)
+        self._redis_client = redis_client
+        self._redis = None
+        self._queue: asyncio.Queue[Tuple[int, str]] = asyncio.Queue()
+        self._workers: List[asyncio.Task] = []
+
+    @property
+    def is_running(self) -> bool:
+        return bool(self._workers)
+
+    async def start(self, bot: Bot) -> None:
+        """הפעלת ה-workers"""
+        if self.is_running:
+            return
+
+        self.bot = bot
+
+        self._redis = self._redis_client if self._redis_client is not None else get_redis_client()
+
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"telegram-dispatcher-{i}")
+            for i in range(self._concurrency)
+        ]
+        logger.info(
+            f"📨 Telegram dispatcher started ({self._concurrency} workers, "
+            f"{'redis' if self._redis else 'memory'} queue)"
+        )
+
+    async def stop(self, drain_timeout: float = 5.0) -> None:
+        """עצירת ה-workers (לאחר ניסיון לרוקן את התור בזיכרון)"""
+        if not self.is_running:
+            return
+
+        if not self._redis:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout=drain_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Telegram dispatcher stopped with {self._queue.qsize()} pending messages")
+
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+        # הלקוח משותף - לא נסגר כאן
+        self._redis = None
+
+        logger.info("🔒 Telegram dispatcher stopped")
+
+    async def enqueue(self, chat_id: int, text: str) -> None:
+        """הכנסת הודעה לתור (חוזר מיד, ללא המתנה לרשת)"""
+        if self._redis:
+            await self._redis.lpush(REDIS_QUEUE_KEY, json.dumps({"chat_id": chat_id, "text": text}))
+        else:
+            self._queue.put_nowait((chat_id, text))
+
+    async def _next_message(self) -> Optional[Tuple[int, str]]:
+        """קבלת ההודעה הבאה מהתור"""
+        if self._redis:
+            item = await self._redis.brpop(REDIS_QUEUE_KEY, timeout=1)
+            if not item:
+                return None
+            payload = json.loads(item[1])
+            return payload["chat_id"], payload["text"]
+
+        return await self._queue.get()
+
+    async def _worker(self) -> None:
+        """לולאת שליחה - מוגבלת קצב, עם backoff לפי retry_after"""
+        while True:
+            # כשל בקריאה לא עוצר את ה-worker - אחרת מספר השולחים יורד בשקט עד אפס
+            try:
+                message = await self._next_message()
+            except Exception as e:
+                logger.error(f"❌ Telegram dispatcher failed to fetch a message: {e}")
+                await asyncio.sleep(FETCH_ERROR_BACKOFF_SECONDS)
+                continue
+
+            if message is None:
+                continue
+
+            chat_id, text = message
+            try:
+                async with self._limiter:
+                    await self.bot.send_message(chat_id=chat_id, text=text)
+
+            except RetryAfter as e:
+                delay = e.retry_after
+                if isinstance(delay, timedelta):
+                    delay = delay.total_seconds()
+                logger.warning(f"Telegram flood control, retrying chat {chat_id} in {delay}s")
+                await asyncio.sleep(delay)
+                await self.enqueue(chat_id, text)
+
+            except TelegramError as e:
+                logger.warning(f"Failed to send notification to chat {chat_id}: {e}")
+
+            except Exception as e:
+                logger.error(f"❌ Telegram dispatcher error: {e}")
+
+            finally:
+                if not self._redis:
+                    self._queue.task_done()
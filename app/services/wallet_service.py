@@ -4,12 +4,19 @@
 """
 
 import logging
+import random
+import uuid
 from datetime import datetime, timezone, timedelta
 from decimal import Decimal
 from typing import Optional, Tuple, Dict, List
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update, and_, or_
-from sqlalchemy.orm import selectinload
+from sqlalchemy import (
+    select, update, insert, values, column, tuple_, and_, func, text, Integer, Numeric
+)
+from sqlalchemy.engine import Row
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm.attributes import set_committed_value
 
 from app.models.user import (
     User, Wallet, Transaction, FundLock, 
@@ -17,9 +24,65 @@ from app.models.user import (
 )
 from app.models.order import Order, OrderStatus
 from app.config import settings
+from app.database import run_after_transaction
+from app.services.redis_client import get_redis_client
+from app.services.idempotency import idempotent
 
 logger = logging.getLogger(__name__)
 
+# cache יתרות לתצוגה: TTL קצר + jitter כדי שמפתחות לא יפוגו יחד (stampede)
+WALLET_CACHE_TTL_SECONDS = 60
+WALLET_CACHE_TTL_JITTER_SECONDS = 15
+
+_ZERO = Decimal('0.00')
+
+# סוגי תנועות לפי השפעה על היתרה (frozenset - בדיקת שייכות O(1) ללא בניית רשימה בכל קריאה)
+_CREDIT_TYPES = frozenset({
+    TransactionType.DEPOSIT,
+    TransactionType.SALE_CREDIT,
+    TransactionType.REFUND,
+    TransactionType.SYSTEM_ADJUSTMENT
+})
+_DEBIT_TYPES = frozenset({
+    TransactionType.PURCHASE_DEBIT,
+    TransactionType.WITHDRAWAL,
+    TransactionType.FEE_DEBIT
+})
+
+# השפעת כל סוג תנועה על היתרות: (כיוון בכוללת, כיוון בקפואה, דורש יתרה זמינה)
+_BALANCE_EFFECTS: Dict[TransactionType, Tuple[int, int, bool]] = {
+    **{transaction_type: (1, 0, False) for transaction_type in _CREDIT_TYPES},   # זיכוי
+    **{transaction_type: (-1, 0, True) for transaction_type in _DEBIT_TYPES},    # חיוב
+    TransactionType.LOCK: (0, 1, True),             # נעילת כספים
+    TransactionType.RELEASE: (0, -1, False),        # שחרור נעילה
+    TransactionType.HOLD_LOCK: (0, 1, False),       # נעילה למוכר (לא משפיע על total - כבר נוכה)
+    TransactionType.HOLD_RELEASE: (1, -1, False),   # שחרור hold למוכר + זיכוי
+}
+
+# האם הפונקציה process_purchase קיימת במסד (נבדק פעם אחת, ראה _use_purchase_db_function)
+_purchase_db_function_available: Optional[bool] = None
+_PURCHASE_DB_FUNCTION_EXISTS_STMT = text(
+    "SELECT to_regprocedure("
+    "'process_purchase(bigint, bigint, numeric, numeric, text, text, text)'"
+    ") IS NOT NULL"
+)
+
+# סוגי תנועות לסטטיסטיקות ארנק (הכנסות / הוצאות)
+_INCOME_TYPES = (
+    TransactionType.DEPOSIT,
+    TransactionType.SALE_CREDIT,
+    TransactionType.REFUND,
+    TransactionType.HOLD_RELEASE
+)
+_EXPENSE_TYPES = (
+    TransactionType.PURCHASE_DEBIT,
+    TransactionType.WITHDRAWAL,
+    TransactionType.FEE_DEBIT
+)
+
+# מפתח advisory lock לניקוי נעילות שפגו (ריצה אחת בכל פעם בין כל התהליכים)
+EXPIRED_LOCKS_CLEANUP_LOCK_KEY = 7_301_001
+
 
 class WalletServiceError(Exception):
     """שגיאות בשירות ארנקים"""
@@ -34,8 +97,12 @@ class InsufficientFundsError(WalletServiceError):
 class WalletService:
     """שירות ניהול ארנקים עם תמיכה מלאה בנעילות ו-holds"""
     
-    def __init__(self, session: AsyncSession):
+    def __init__(self, session: AsyncSession, redis_client=None):
         self.session = session
+        # Redis ל-cache של יתרות לתצוגה בלבד (None - ללא cache)
+        self.redis = redis_client if redis_client is not None else get_redis_client()
+        # משתמשים שהיתרה שלהם השתנתה בטרנזקציה הפתוחה - ה-cache נמחק אחרי commit
+        self._stale_wallet_users: set = set()
     
     # === Basic Wallet Operations ===
     
@@ -62,8 +129,8 @@ class WalletService:
             user_id=user_id,
             transactions=[],
             fund_locks=[],
-            total_balance=Decimal('0.00'),
-            locked_balance=Decimal('0.00')
+            total_balance=_ZERO,
+            locked_balance=_ZERO
         )
         self.session.add(wallet)
         await self.session.flush()
@@ -71,11 +138,46 @@ class WalletService:
         return wallet
     
     async def get_or_create_wallet(self, user_id: int) -> Wallet:
-        """קבלת ארנק או יצירה אם לא קיים"""
+        """
+        קבלת ארנק או יצירה אם לא קיים.
+        ארנק קיים - SELECT יחיד (ללא כתיבה); ארנק חסר - upsert יחיד שמחזיר את השורה,
+        כך ששתי בקשות מקבילות לאותו משתמש לא נכשלות על unique(user_id)
+        """
         wallet = await self.get_wallet(user_id)
-        if not wallet:
-            wallet = await self.create_wallet(user_id)
-        return wallet
+        if wallet:
+            return wallet
+        
+        # חותמות הזמן מהשעון של המסד (RETURNING מחזיר אותן לאובייקט)
+        stmt = pg_insert(Wallet).values(
+            user_id=user_id,
+            total_balance=_ZERO,
+            locked_balance=_ZERO,
+            created_at=func.now(),
+            updated_at=func.now()
+        )
+        # DO UPDATE (ולא DO NOTHING) כדי ש-RETURNING יחזיר את השורה גם כשמישהו יצר אותה במקביל
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Wallet.user_id],
+            set_={'user_id': stmt.excluded.user_id}
+        ).returning(Wallet)
+        
+        result = await self.session.execute(stmt)
+        return result.scalar_one()
+    
+    async def get_or_create_wallets(self, *user_ids: int) -> Dict[int, Wallet]:
+        """
+        קבלת ארנקים לכמה משתמשים בשאילתה אחת (קונה + מוכר), ויצירת החסרים.
+        Returns: {user_id: Wallet}
+        """
+        stmt = select(Wallet).where(Wallet.user_id.in_(set(user_ids)))
+        result = await self.session.execute(stmt)
+        wallets = {wallet.user_id: wallet for wallet in result.scalars()}
+        
+        for user_id in user_ids:
+            if user_id not in wallets:
+                wallets[user_id] = await self.get_or_create_wallet(user_id)
+        
+        return wallets
     
     # === Balance Display (UI Helper) ===
     
@@ -84,12 +186,89 @@ class WalletService:
         קבלת יתרות לתצוגה
         Returns: {"total": xxx, "locked": xxx, "available": xxx}
         """
+        cached = await self._load_wallet_cache(user_id)
+        if cached:
+            return cached
+        
         wallet = await self.get_or_create_wallet(user_id)
-        return {
+        balance_display = {
             "total": wallet.total_balance,      # 💰 כוללת
             "locked": wallet.locked_balance,    # 🔒 קפואה
             "available": wallet.available_balance  # ✅ זמינה
         }
+        
+        await self._store_wallet_cache(user_id, balance_display)
+        return balance_display
+    
+    # === Balance Cache (Redis) ===
+    
+    @staticmethod
+    def _wallet_cache_key(user_id: int) -> str:
+        return f"wallet:{user_id}"
+    
+    async def _load_wallet_cache(self, user_id: int) -> Optional[Dict[str, Decimal]]:
+        """קריאת יתרות לתצוגה מה-cache (None אם אין cache או החמצה)"""
+        if not self.redis:
+            return None
+        
+        try:
+            cached = await self.redis.hgetall(self._wallet_cache_key(user_id))
+        except Exception as e:
+            logger.warning("Wallet cache read failed for user %s: %s", user_id, e)
+            return None
+        
+        if not cached:
+            return None
+        
+        return {field: Decimal(value) for field, value in cached.items()}
+    
+    async def _store_wallet_cache(self, user_id: int, balance_display: Dict[str, Decimal]):
+        """שמירת יתרות לתצוגה ב-cache עם TTL קצר"""
+        if not self.redis:
+            return
+        
+        key = self._wallet_cache_key(user_id)
+        ttl = WALLET_CACHE_TTL_SECONDS + random.randint(0, WALLET_CACHE_TTL_JITTER_SECONDS)
+        
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.hset(key, mapping={field: str(value) for field, value in balance_display.items()})
+                pipe.expire(key, ttl)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning("Wallet cache write failed for user %s: %s", user_id, e)
+    
+    async def _invalidate_wallet_cache(self, *user_ids: int):
+        """מחיקת היתרות מה-cache אחרי כל שינוי יתרה (DEL אחד לכל המשתמשים)"""
+        if not self.redis or not user_ids:
+            return
+        
+        try:
+            await self.redis.delete(*[self._wallet_cache_key(user_id) for user_id in user_ids])
+        except Exception as e:
+            logger.warning("Wallet cache invalidation failed for users %s: %s", user_ids, e)
+    
+    def _invalidate_wallet_cache_after_commit(self, *user_ids: int):
+        """
+        סימון היתרות למחיקה מה-cache בסוף הטרנזקציה.
+        מחיקה לפני commit מאפשרת לקריאה מקבילה לטעון שוב את היתרה הישנה ל-cache
+        """
+        if not self.redis or not user_ids:
+            return
+        
+        if not self._stale_wallet_users:
+            run_after_transaction(
+                self.session, self._flush_wallet_cache_invalidation, self._discard_wallet_cache_invalidation
+            )
+        self._stale_wallet_users.update(user_ids)
+    
+    async def _flush_wallet_cache_invalidation(self):
+        user_ids, self._stale_wallet_users = self._stale_wallet_users, set()
+        await self._invalidate_wallet_cache(*user_ids)
+    
+    async def _discard_wallet_cache_invalidation(self):
+        # rollback - היתרות במסד לא השתנו ואין מה למחוק
+        self._stale_wallet_users = set()
     
     # === Transaction Management ===
     
@@ -105,72 +284,175 @@ class WalletService:
         admin_id: Optional[int] = None
     ) -> Transaction:
         """יצירת רשומת תנועה עם עדכון יתרות"""
+        row = await self._prepare_transaction_row(
+            wallet=wallet,
+            transaction_type=transaction_type,
+            amount=amount,
+            description=description,
+            reference_type=reference_type,
+            reference_id=reference_id,
+            metadata=metadata,
+            admin_id=admin_id
+        )
         
-        # שמירת יתרות לפני השינוי
-        balance_before = wallet.total_balance
-        locked_before = wallet.locked_balance
-        
-        # עדכון יתרות לפי סוג התנועה
-        if transaction_type in [
-            TransactionType.DEPOSIT, 
-            TransactionType.SALE_CREDIT, 
-            TransactionType.REFUND,
-            TransactionType.SYSTEM_ADJUSTMENT
-        ]:
-            # זיכוי
-            wallet.total_balance += amount
-            
-        elif transaction_type in [
-            TransactionType.PURCHASE_DEBIT, 
-            TransactionType.WITHDRAWAL, 
-            TransactionType.FEE_DEBIT
-        ]:
-            # חיוב
-            if wallet.available_balance < amount:
-                raise InsufficientFundsError(f"Insufficient funds: need {amount}, have {wallet.available_balance}")
-            wallet.total_balance -= amount
-            
-        elif transaction_type == TransactionType.LOCK:
-            # נעילת כספים
-            if wallet.available_balance < amount:
-                raise InsufficientFundsError(f"Cannot lock {amount}, available: {wallet.available_balance}")
-            wallet.locked_balance += amount
-            
-        elif transaction_type == TransactionType.RELEASE:
-            # שחרור נעילה
-            wallet.locked_balance -= amount
-            
-        elif transaction_type == TransactionType.HOLD_LOCK:
-            # נעילה למוכר (לא משפיע על total - כבר נוכה)
-            wallet.locked_balance += amount
-            
-        elif transaction_type == TransactionType.HOLD_RELEASE:
-            # שחרור hold למוכר
-            wallet.locked_balance -= amount
-            wallet.total_balance += amount  # זיכוי למוכר
+        transaction, = await self._insert_transactions([row])
+        return transaction
+    
+    async def _prepare_transaction_row(
+        self,
+        wallet: Wallet,
+        transaction_type: TransactionType,
+        amount: Decimal,
+        description: str,
+        reference_type: Optional[str] = None,
+        reference_id: Optional[str] = None,
+        metadata: Optional[str] = None,
+        admin_id: Optional[int] = None
+    ) -> Dict:
+        """
+        עדכון היתרות לפי סוג התנועה ובניית שורת התנועה - ללא INSERT.
+        פעולות מורכבות (רכישה, החזר) אוספות כמה שורות ומכניסות אותן יחד
+        """
+        # שינוי היתרות לפי סוג התנועה (טבלה במקום שרשרת if/elif)
+        effect = _BALANCE_EFFECTS.get(transaction_type)
+        if effect is None:
+            raise WalletServiceError(f"Unsupported transaction type: {transaction_type}")
+        
+        total_sign, locked_sign, requires_available = effect
+        total_delta = amount * total_sign
+        locked_delta = amount * locked_sign
+        required_available = amount if requires_available else None
         
-        # יצירת רשומת התנועה
-        transaction = Transaction(
+        balances = await self._apply_balance_delta(
+            wallet, total_delta, locked_delta, required_available
+        )
+        if balances is None:
+            raise InsufficientFundsError(
+                f"Insufficient funds for {transaction_type.value}: need {amount}, have {wallet.available_balance}"
+            )
+        
+        balance_after, locked_after = balances
+        self._invalidate_wallet_cache_after_commit(wallet.user_id)
+        
+        return self._build_transaction_row(
             user_id=wallet.user_id,
             wallet_id=wallet.id,
-            type=transaction_type,
+            transaction_type=transaction_type,
             amount=amount,
             description=description,
+            balance_before=balance_after - total_delta,
+            balance_after=balance_after,
+            locked_before=locked_after - locked_delta,
+            locked_after=locked_after,
             reference_type=reference_type,
             reference_id=reference_id,
-            extra_metadata=metadata,
-            processed_by_admin_id=admin_id,
-            balance_before=balance_before,
-            balance_after=wallet.total_balance,
-            locked_before=locked_before,
-            locked_after=wallet.locked_balance
+            metadata=metadata,
+            admin_id=admin_id
+        )
+    
+    async def _insert_transactions(self, rows: List[Dict]) -> List[Transaction]:
+        """INSERT אחד לכל שורות התנועה, מחזיר אובייקטי Transaction באותו סדר"""
+        result = await self.session.scalars(
+            insert(Transaction).returning(Transaction, sort_by_parameter_order=True),
+            rows
         )
+        transactions = list(result.all())
         
-        self.session.add(transaction)
-        await self.session.flush()
+        # מסלול חם - בלי עיצוב מחרוזות כשרמת INFO כבויה
+        if logger.isEnabledFor(logging.INFO):
+            for transaction in transactions:
+                logger.info(
+                    "Transaction created: %s %s for user %s",
+                    transaction.type.value, transaction.amount, transaction.user_id
+                )
         
-        logger.info(f"Transaction created: {transaction_type.value} {amount} for user {wallet.user_id}")
-        return transaction
+        return transactions
+    
+    async def _apply_balance_delta(
+        self,
+        wallet: Wallet,
+        total_delta: Decimal,
+        locked_delta: Decimal,
+        required_available: Optional[Decimal] = None
+    ) -> Optional[Tuple[Decimal, Decimal]]:
+        """
+        עדכון יתרות אטומי במסד - UPDATE ... RETURNING יחיד במקום קריאה-שינוי-כתיבה בפייתון.
+        בדיקת היתרה הזמינה היא חלק מה-WHERE, כך ששתי עסקאות מקבילות לא יחייבו מעבר ליתרה.
+        Returns: (יתרה כוללת, יתרה קפואה) אחרי העדכון, או None אם אין יתרה זמינה מספקת
+        """
+        balances = await self._update_wallet_balances(
+            wallet.id, total_delta, locked_delta, required_available
+        )
+        if balances is None:
+            return None
+        
+        # עדכון האובייקט בזיכרון בלי לסמן אותו כ-dirty (אחרת ה-flush ידרוס את העדכון)
+        total_balance, locked_balance = balances
+        set_committed_value(wallet, 'total_balance', total_balance)
+        set_committed_value(wallet, 'locked_balance', locked_balance)
+        return total_balance, locked_balance
+    
+    async def _update_wallet_balances(
+        self,
+        wallet_id: int,
+        total_delta: Decimal,
+        locked_delta: Decimal,
+        required_available: Optional[Decimal] = None
+    ) -> Optional[Tuple[Decimal, Decimal]]:
+        """UPDATE ... RETURNING על ארנק לפי id (ללא אובייקט ORM)"""
+        stmt = update(Wallet).where(Wallet.id == wallet_id).values(
+            total_balance=Wallet.total_balance + total_delta,
+            locked_balance=Wallet.locked_balance + locked_delta
+        ).returning(
+            Wallet.total_balance, Wallet.locked_balance
+        ).execution_options(synchronize_session=False)
+        
+        if required_available is not None:
+            stmt = stmt.where(
+                Wallet.total_balance - Wallet.locked_balance >= required_available
+            )
+        
+        result = await self.session.execute(stmt)
+        row = result.one_or_none()
+        if row is None:
+            return None
+        
+        return row[0], row[1]
+    
+    @staticmethod
+    def _build_transaction_row(
+        user_id: int,
+        wallet_id: int,
+        transaction_type: TransactionType,
+        amount: Decimal,
+        description: str,
+        balance_before: Decimal,
+        balance_after: Decimal,
+        locked_before: Decimal,
+        locked_after: Decimal,
+        reference_type: Optional[str] = None,
+        reference_id: Optional[str] = None,
+        metadata: Optional[str] = None,
+        admin_id: Optional[int] = None
+    ) -> Dict:
+        """בניית שורת Transaction ל-INSERT מרוכז (ללא גישה למסד)"""
+        return {
+            "id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "wallet_id": wallet_id,
+            "type": transaction_type,
+            "amount": amount,
+            "description": description,
+            "reference_type": reference_type,
+            "reference_id": reference_id,
+            "extra_metadata": metadata,
+            "processed_by_admin_id": admin_id,
+            "balance_before": balance_before,
+            "balance_after": balance_after,
+            "locked_before": locked_before,
+            "locked_after": locked_after,
+            "created_at": datetime.now(timezone.utc),
+        }
     
     # === Fund Locks Management ===
     
@@ -216,7 +498,7 @@ class WalletService:
         self.session.add(fund_lock)
         await self.session.flush()
         
-        logger.info(f"Fund lock created: {amount}₪ for user {user_id}, reason: {reason}")
+        logger.info("Fund lock created: %s₪ for user %s, reason: %s", amount, user_id, reason)
         return fund_lock
     
     async def release_fund_lock(
@@ -224,34 +506,16 @@ class WalletService:
         lock_id: str, 
         admin_id: Optional[int] = None
     ) -> bool:
-        """שחרור נעילת כספים"""
-        stmt = select(FundLock).where(
-            and_(FundLock.id == lock_id, FundLock.is_active == True)
+        """שחרור נעילת כספים - UPDATE ... RETURNING יחיד, ללא SELECT מקדים"""
+        released_locks = await self._release_fund_locks_where(
+            FundLock.id == lock_id, admin_id=admin_id
         )
-        result = await self.session.execute(stmt)
-        fund_lock = result.scalar_one_or_none()
         
-        if not fund_lock:
+        # הנעילה לא קיימת או כבר שוחררה (גם ע"י שחרור מקביל)
+        if not released_locks:
             return False
         
-        # עדכון הנעילה כלא פעילה
-        fund_lock.is_active = False
-        fund_lock.released_at = datetime.now(timezone.utc)
-        
-        # קבלת הארנק ושחרור הכספים
-        wallet = await self.get_wallet(fund_lock.user_id)
-        if wallet:
-            await self.create_transaction(
-                wallet=wallet,
-                transaction_type=TransactionType.RELEASE,
-                amount=fund_lock.amount,
-                description=f"שחרור נעילה: {fund_lock.reason}",
-                reference_type=fund_lock.reference_type,
-                reference_id=fund_lock.reference_id,
-                admin_id=admin_id
-            )
-        
-        logger.info(f"Fund lock released: {lock_id}, amount: {fund_lock.amount}₪")
+        logger.info("Fund lock released: %s, amount: %s₪", lock_id, released_locks[0].amount)
         return True
     
     async def update_fund_lock_amount(
@@ -260,15 +524,24 @@ class WalletService:
         new_amount: Decimal
     ) -> bool:
         """עדכון סכום נעילה (למכרזים - הצעה חדשה)"""
-        stmt = select(FundLock).where(
-            and_(FundLock.id == lock_id, FundLock.is_active == True)
-        )
-        result = await self.session.execute(stmt)
-        fund_lock = result.scalar_one_or_none()
+        fund_lock = await self._get_active_fund_lock(lock_id)
         
         if not fund_lock:
             return False
         
+        await self._resize_fund_lock(fund_lock, new_amount)
+        return True
+    
+    async def _get_active_fund_lock(self, lock_id: str) -> Optional[FundLock]:
+        """קבלת נעילה פעילה עם נעילת שורה (עדכונים מקבילים לאותה נעילה מסודרים בתור)"""
+        stmt = select(FundLock).where(
+            and_(FundLock.id == lock_id, FundLock.is_active == True)
+        ).with_for_update()
+        result = await self.session.execute(stmt)
+        return result.scalar_one_or_none()
+    
+    async def _resize_fund_lock(self, fund_lock: FundLock, new_amount: Decimal):
+        """שינוי סכום נעילה קיימת - תנועת LOCK / RELEASE על ההפרש בלבד"""
         wallet = await self.get_wallet(fund_lock.user_id)
         old_amount = fund_lock.amount
         amount_diff = new_amount - old_amount
@@ -301,10 +574,10 @@ class WalletService:
             )
         
         fund_lock.amount = new_amount
-        return True
     
     # === Purchase Flow ===
     
+    @idempotent("purchase", key_arg="order_id")
     async def process_purchase(
         self,
         buyer_id: int,
@@ -317,6 +590,7 @@ class WalletService:
         עיבוד רכישה מלא:
         1. חיוב קונה (כולל עמלה)
         2. נעילת hold למוכר
+        order_id משמש כמפתח idempotency - retry של אותה הזמנה מחזיר את התנועות הקיימות
         """
         buyer_fee, seller_fee = calculate_fees(
             total_amount, 
@@ -326,32 +600,120 @@ class WalletService:
         
         buyer_total = total_amount + buyer_fee
         seller_net = total_amount - seller_fee
+        buyer_description = f"רכישת קופון (כולל עמלה {buyer_fee}₪)"
+        seller_description = f"החזקת תשלום למוכר (נטו {seller_net}₪)"
+        
+        if await self._use_purchase_db_function():
+            return await self._process_purchase_in_db(
+                buyer_id, seller_id, buyer_total, seller_net, order_id,
+                buyer_description, seller_description
+            )
+        
+        # שני הארנקים ב-round trip אחד
+        wallets = await self.get_or_create_wallets(buyer_id, seller_id)
         
         # חיוב הקונה
-        buyer_wallet = await self.get_or_create_wallet(buyer_id)
-        buyer_transaction = await self.create_transaction(
-            wallet=buyer_wallet,
+        buyer_row = await self._prepare_transaction_row(
+            wallet=wallets[buyer_id],
             transaction_type=TransactionType.PURCHASE_DEBIT,
             amount=buyer_total,
-            description=f"רכישת קופון (כולל עמלה {buyer_fee}₪)",
+            description=buyer_description,
             reference_type="order",
             reference_id=order_id
         )
         
         # Hold למוכר (יזוכה אחרי 24h או אישור מוקדם)
-        seller_wallet = await self.get_or_create_wallet(seller_id)
-        seller_transaction = await self.create_transaction(
-            wallet=seller_wallet,
+        seller_row = await self._prepare_transaction_row(
+            wallet=wallets[seller_id],
             transaction_type=TransactionType.HOLD_LOCK,
             amount=seller_net,
-            description=f"החזקת תשלום למוכר (נטו {seller_net}₪)",
+            description=seller_description,
             reference_type="order",
             reference_id=order_id
         )
         
-        logger.info(f"Purchase processed: buyer={buyer_id} paid {buyer_total}₪, seller={seller_id} hold {seller_net}₪")
+        # שתי התנועות ב-INSERT אחד
+        buyer_transaction, seller_transaction = await self._insert_transactions(
+            [buyer_row, seller_row]
+        )
+        
+        logger.info(
+            "Purchase processed: buyer=%s paid %s₪, seller=%s hold %s₪",
+            buyer_id, buyer_total, seller_id, seller_net
+        )
         return buyer_transaction, seller_transaction
     
+    async def _use_purchase_db_function(self) -> bool:
+        """
+        הפונקציה process_purchase קיימת רק ב-PostgreSQL שהורצה עליו מיגרציה 20261016_05.
+        סכמה שנבנתה ב-create_all (בלי alembic) - חוזרים למסלול ה-Python.
+        בדיקת הקטלוג מתבצעת פעם אחת לתהליך
+        """
+        global _purchase_db_function_available
+        
+        if not (
+            settings.WALLET_PURCHASE_DB_FUNCTION
+            and self.session.bind is not None
+            and self.session.bind.dialect.name == "postgresql"
+        ):
+            return False
+        
+        if _purchase_db_function_available is None:
+            _purchase_db_function_available = bool(
+                await self.session.scalar(_PURCHASE_DB_FUNCTION_EXISTS_STMT)
+            )
+            if not _purchase_db_function_available:
+                logger.warning("process_purchase DB function not found, using the Python purchase flow")
+        
+        return _purchase_db_function_available
+    
+    async def _process_purchase_in_db(
+        self,
+        buyer_id: int,
+        seller_id: int,
+        buyer_total: Decimal,
+        seller_net: Decimal,
+        order_id: str,
+        buyer_description: str,
+        seller_description: str
+    ) -> Tuple[Transaction, Transaction]:
+        """רכישה בקריאה אחת לפונקציה במסד: שני הארנקים, החיוב, ה-hold ושתי התנועות"""
+        stmt = select(Transaction).from_statement(
+            text(
+                "SELECT * FROM process_purchase("
+                ":buyer_id, :seller_id, :buyer_total, :seller_net, "
+                ":order_id, :buyer_description, :seller_description)"
+            )
+        )
+        try:
+            # savepoint - חריגה בפונקציה מבטלת רק אותה, וה-session של הקורא נשאר שמיש
+            # (כמו במסלול הפייתון, שבו יתרה לא מספקת לא שוברת את הטרנזקציה)
+            async with self.session.begin_nested():
+                result = await self.session.scalars(stmt, {
+                    "buyer_id": buyer_id,
+                    "seller_id": seller_id,
+                    "buyer_total": buyer_total,
+                    "seller_net": seller_net,
+                    "order_id": order_id,
+                    "buyer_description": buyer_description,
+                    "seller_description": seller_description,
+                })
+                transactions = {transaction.type: transaction for transaction in result.all()}
+        except DBAPIError as e:
+            if "insufficient_funds" in str(e.orig):
+                raise InsufficientFundsError(
+                    f"Insufficient funds for {TransactionType.PURCHASE_DEBIT.value}: need {buyer_total}"
+                ) from e
+            raise
+        
+        self._invalidate_wallet_cache_after_commit(buyer_id, seller_id)
+        
+        logger.info(
+            "Purchase processed in DB: buyer=%s paid %s₪, seller=%s hold %s₪",
+            buyer_id, buyer_total, seller_id, seller_net
+        )
+        return transactions[TransactionType.PURCHASE_DEBIT], transactions[TransactionType.HOLD_LOCK]
+    
     async def release_seller_hold(
         self, 
         order_id: str, 
@@ -375,7 +737,7 @@ class WalletService:
         hold_transaction = result.scalar_one_or_none()
         
         if not hold_transaction:
-            logger.warning(f"No hold transaction found for order {order_id}")
+            logger.warning("No hold transaction found for order %s", order_id)
             return False
         
         # שחרור ה-hold
@@ -391,27 +753,45 @@ class WalletService:
             admin_id=admin_id
         )
         
-        logger.info(f"Seller hold released: order={order_id}, amount={hold_transaction.amount}₪")
+        logger.info("Seller hold released: order=%s, amount=%s₪", order_id, hold_transaction.amount)
         return True
     
     # === Auction Flow ===
     
+    @idempotent("bid", key_arg="idempotency_key")
     async def place_auction_bid(
         self,
         bidder_id: int,
         auction_id: str,
         bid_amount: Decimal,
-        previous_bid_lock_id: Optional[str] = None
+        previous_bid_lock_id: Optional[str] = None,
+        idempotency_key: Optional[str] = None
     ) -> FundLock:
-        """הגשת הצעה במכרז עם נעילת כספים"""
+        """הגשת הצעה במכרז עם נעילת כספים (idempotency_key - הגנה מהגשה כפולה)"""
+        # נעילה למשך זמן המכרז + רזרבה. נשאר בצד האפליקציה: ערך func.now() היה פג
+        # ב-flush וקריאת expires_at מהאובייקט המוחזר הייתה דורשת טעינה נוספת
+        expires_at = datetime.now(timezone.utc) + timedelta(hours=48)
         
-        # שחרור נעילה קודמת (אם יש)
         if previous_bid_lock_id:
+            previous_lock = await self._get_active_fund_lock(previous_bid_lock_id)
+            
+            # המציע מעלה את ההצעה שלו - נעילת ההפרש בלבד על אותה נעילה,
+            # במקום שחרור מלא ונעילה מחדש (תנועה אחת ועדכון ארנק אחד במקום שניים)
+            if (
+                previous_lock
+                and previous_lock.user_id == bidder_id
+                and previous_lock.reference_type == "auction"
+                and previous_lock.reference_id == auction_id
+            ):
+                await self._resize_fund_lock(previous_lock, bid_amount)
+                previous_lock.expires_at = expires_at
+                await self.session.flush()
+                return previous_lock
+            
+            # שחרור נעילה קודמת (אם יש)
             await self.release_fund_lock(previous_bid_lock_id)
         
         # נעילה חדשה לסכום ההצעה
-        expires_at = datetime.now(timezone.utc) + timedelta(hours=48)  # נעילה למשך זמן המכרז + רזרבה
-        
         fund_lock = await self.create_fund_lock(
             user_id=bidder_id,
             amount=bid_amount,
@@ -453,27 +833,112 @@ class WalletService:
         winner_id: int
     ) -> int:
         """שחרור נעילות המפסידים במכרז"""
-        stmt = select(FundLock).where(
+        released_locks = await self._release_fund_locks_where(
             and_(
                 FundLock.reference_type == "auction",
                 FundLock.reference_id == auction_id,
-                FundLock.user_id != winner_id,
-                FundLock.is_active == True
+                FundLock.user_id != winner_id
             )
         )
+        count = len(released_locks)
+        
+        logger.info("Released %s losing auction bids for auction %s", count, auction_id)
+        return count
+    
+    async def _release_fund_locks_where(self, condition, admin_id: Optional[int] = None) -> List:
+        """
+        שחרור כל הנעילות הפעילות שעונות לתנאי, בפעולות מרוכזות:
+        UPDATE אחד לנעילות (RETURNING), UPDATE אחד לכל הארנקים, ו-INSERT אחד לתנועות
+        Returns: שורות הנעילות ששוחררו
+        """
+        stmt = update(FundLock).where(
+            and_(condition, FundLock.is_active == True)
+        ).values(
+            is_active=False,
+            released_at=func.now()
+        ).returning(
+            FundLock.wallet_id,
+            FundLock.user_id,
+            FundLock.amount,
+            FundLock.reason,
+            FundLock.reference_type,
+            FundLock.reference_id
+        ).execution_options(synchronize_session=False)
+        
         result = await self.session.execute(stmt)
-        losing_locks = result.scalars().all()
+        released_locks = result.all()
+        if not released_locks:
+            return []
         
-        count = 0
-        for lock in losing_locks:
-            await self.release_fund_lock(lock.id)
-            count += 1
+        # סכום לשחרור לכל ארנק
+        amounts_by_wallet: Dict[int, Decimal] = {}
+        for lock in released_locks:
+            amounts_by_wallet[lock.wallet_id] = (
+                amounts_by_wallet.get(lock.wallet_id, _ZERO) + lock.amount
+            )
         
-        logger.info(f"Released {count} losing auction bids for auction {auction_id}")
-        return count
+        balances = await self._release_locked_balances(amounts_by_wallet)
+        
+        # תנועת RELEASE לכל נעילה, עם יתרה קפואה רצה בתוך כל ארנק
+        locked_running = {
+            wallet_id: balances[wallet_id][1] + amount
+            for wallet_id, amount in amounts_by_wallet.items()
+        }
+        transaction_rows = []
+        for lock in released_locks:
+            total_balance = balances[lock.wallet_id][0]
+            locked_before = locked_running[lock.wallet_id]
+            locked_after = locked_before - lock.amount
+            locked_running[lock.wallet_id] = locked_after
+            
+            transaction_rows.append(self._build_transaction_row(
+                user_id=lock.user_id,
+                wallet_id=lock.wallet_id,
+                transaction_type=TransactionType.RELEASE,
+                amount=lock.amount,
+                description=f"שחרור נעילה: {lock.reason}",
+                balance_before=total_balance,
+                balance_after=total_balance,
+                locked_before=locked_before,
+                locked_after=locked_after,
+                reference_type=lock.reference_type,
+                reference_id=lock.reference_id,
+                admin_id=admin_id
+            ))
+        
+        await self.session.execute(insert(Transaction), transaction_rows)
+        self._invalidate_wallet_cache_after_commit(*{lock.user_id for lock in released_locks})
+        
+        return released_locks
+    
+    async def _release_locked_balances(
+        self,
+        amounts_by_wallet: Dict[int, Decimal]
+    ) -> Dict[int, Tuple[Decimal, Decimal]]:
+        """
+        הפחתת היתרה הקפואה בכל הארנקים ב-UPDATE ... FROM (VALUES ...) יחיד.
+        Returns: wallet_id -> (total_balance, locked_balance) אחרי העדכון
+        """
+        released = values(
+            column("wallet_id", Integer),
+            column("amount", Numeric(12, 2)),
+            name="released"
+        ).data(list(amounts_by_wallet.items()))
+        
+        stmt = update(Wallet).where(
+            Wallet.id == released.c.wallet_id
+        ).values(
+            locked_balance=Wallet.locked_balance - released.c.amount
+        ).returning(
+            Wallet.id, Wallet.total_balance, Wallet.locked_balance
+        ).execution_options(synchronize_session=False)
+        
+        result = await self.session.execute(stmt)
+        return {row.id: (row.total_balance, row.locked_balance) for row in result}
     
     # === Refund & Dispute Management ===
     
+    @idempotent("refund", key_arg="idempotency_key")
     async def process_refund(
         self,
         order_id: str,
@@ -482,27 +947,35 @@ class WalletService:
         refund_amount: Decimal,
         reason: str,
         admin_id: int,
-        partial: bool = False
+        partial: bool = False,
+        idempotency_key: Optional[str] = None
     ) -> Tuple[Transaction, Optional[Transaction]]:
-        """עיבוד החזר (מלא או חלקי)"""
+        """
+        עיבוד החזר (מלא או חלקי).
+        idempotency_key - מפתח מהקורא (להזמנה יכולים להיות כמה החזרים חלקיים)
+        """
+        
+        # שני הארנקים ב-round trip אחד (ארנק המוכר נדרש רק בהחזר מלא)
+        if partial:
+            wallets = await self.get_or_create_wallets(buyer_id)
+        else:
+            wallets = await self.get_or_create_wallets(buyer_id, seller_id)
         
         # החזר לקונה
-        buyer_wallet = await self.get_or_create_wallet(buyer_id)
-        buyer_refund = await self.create_transaction(
-            wallet=buyer_wallet,
+        rows = [await self._prepare_transaction_row(
+            wallet=wallets[buyer_id],
             transaction_type=TransactionType.REFUND,
             amount=refund_amount,
             description=f"החזר {'חלקי' if partial else 'מלא'}: {reason}",
             reference_type="order",
             reference_id=order_id,
             admin_id=admin_id
-        )
+        )]
         
         # אם זה החזר מלא, צריך לשחרר גם את ה-hold מהמוכר
-        seller_refund = None
         if not partial:
             # חיפוש hold של המוכר ושחרור
-            seller_wallet = await self.get_or_create_wallet(seller_id)
+            seller_wallet = wallets[seller_id]
             stmt = select(Transaction).where(
                 and_(
                     Transaction.wallet_id == seller_wallet.id,
@@ -515,7 +988,7 @@ class WalletService:
             hold_transaction = result.scalar_one_or_none()
             
             if hold_transaction:
-                seller_refund = await self.create_transaction(
+                rows.append(await self._prepare_transaction_row(
                     wallet=seller_wallet,
                     transaction_type=TransactionType.RELEASE,
                     amount=hold_transaction.amount,
@@ -523,9 +996,14 @@ class WalletService:
                     reference_type="order",
                     reference_id=order_id,
                     admin_id=admin_id
-                )
+                ))
+        
+        # כל תנועות ההחזר ב-INSERT אחד
+        transactions = await self._insert_transactions(rows)
+        buyer_refund = transactions[0]
+        seller_refund = transactions[1] if len(transactions) > 1 else None
         
-        logger.info(f"Refund processed: order={order_id}, amount={refund_amount}₪, partial={partial}")
+        logger.info("Refund processed: order=%s, amount=%s₪, partial=%s", order_id, refund_amount, partial)
         return buyer_refund, seller_refund
     
     # === Admin Functions ===
@@ -550,66 +1028,94 @@ class WalletService:
             admin_id=admin_id
         )
         
-        logger.info(f"Admin added balance: {amount}₪ to user {user_id} by admin {admin_id}")
+        logger.info("Admin added balance: %s₪ to user %s by admin %s", amount, user_id, admin_id)
         return transaction
     
     async def get_user_transaction_history(
         self,
         user_id: int,
         limit: int = 50,
-        transaction_type: Optional[TransactionType] = None
-    ) -> List[Transaction]:
-        """קבלת היסטוריית תנועות משתמש"""
-        stmt = select(Transaction).where(Transaction.user_id == user_id)
+        transaction_type: Optional[TransactionType] = None,
+        *,
+        cursor: Optional[Tuple[datetime, int]] = None
+    ) -> List[Row]:
+        """
+        קבלת היסטוריית תנועות משתמש (עמוד אחד, מהחדשה לישנה).
+        Returns: שורות Row (לא ישויות Transaction) עם id, type, amount, description, created_at -
+        לתצוגה בלבד. לעמוד הבא מעבירים cursor=(rows[-1].created_at, rows[-1].id);
+        ה-id מפריד בין תנועות עם אותו created_at
+        """
+        stmt = select(
+            Transaction.id,
+            Transaction.type,
+            Transaction.amount,
+            Transaction.description,
+            Transaction.created_at
+        ).where(Transaction.user_id == user_id)
+        
+        if cursor is not None:
+            # keyset על idx_transactions_user_created במקום OFFSET
+            stmt = stmt.where(tuple_(Transaction.created_at, Transaction.id) < tuple(cursor))
         
         if transaction_type:
             stmt = stmt.where(Transaction.type == transaction_type)
         
-        stmt = stmt.order_by(Transaction.created_at.desc()).limit(limit)
+        stmt = stmt.order_by(Transaction.created_at.desc(), Transaction.id.desc()).limit(limit)
         
         result = await self.session.execute(stmt)
-        return list(result.scalars().all())
+        return list(result.all())
     
     # === Scheduled Tasks Helpers ===
     
     async def get_expired_fund_locks(self) -> List[FundLock]:
         """קבלת נעילות כספים שפגו"""
-        now = datetime.now(timezone.utc)
         stmt = select(FundLock).where(
             and_(
                 FundLock.is_active == True,
                 FundLock.expires_at.isnot(None),
-                FundLock.expires_at < now
+                FundLock.expires_at < func.now()
             )
         )
         result = await self.session.execute(stmt)
         return list(result.scalars().all())
     
     async def cleanup_expired_locks(self) -> int:
-        """ניקוי נעילות שפגו"""
-        expired_locks = await self.get_expired_fund_locks()
-        count = 0
+        """ניקוי נעילות שפגו - כל הנעילות בפעולה מרוכזת אחת"""
+        # ריצה מקבילה מתהליך אחר כבר מנקה - מדלגים במקום לחכות לה.
+        # נעילת טרנזקציה (xact) משתחררת לבד ב-commit, גם בלי איפוס חיבורים ב-pool
+        acquired = await self.session.scalar(
+            select(func.pg_try_advisory_xact_lock(EXPIRED_LOCKS_CLEANUP_LOCK_KEY))
+        )
+        if not acquired:
+            return 0
         
-        for lock in expired_locks:
-            await self.release_fund_lock(lock.id)
-            count += 1
+        released_locks = await self._release_fund_locks_where(
+            and_(
+                FundLock.expires_at.isnot(None),
+                FundLock.expires_at < func.now()
+            )
+        )
+        count = len(released_locks)
         
-        logger.info(f"Cleaned up {count} expired fund locks")
+        logger.info("Cleaned up %s expired fund locks", count)
         return count
     
-    async def get_orders_ready_for_release(self) -> List[str]:
-        """קבלת הזמנות שמוכנות לשחרור hold"""
-        now = datetime.now(timezone.utc)
-        stmt = select(Order.id).where(
+    async def get_orders_ready_for_release(self, limit: int = 100) -> List[Order]:
+        """
+        תפיסת אצווה של הזמנות שמוכנות לשחרור hold.
+        FOR UPDATE SKIP LOCKED - השורות נעולות עד סוף הטרנזקציה של הקורא,
+        ו-workers מקבילים מקבלים אצוות זרות במקום לשחרר את אותה הזמנה פעמיים
+        """
+        stmt = select(Order).where(
             and_(
                 Order.status == OrderStatus.DELIVERED,
                 Order.seller_hold_until.isnot(None),
-                Order.seller_hold_until <= now,
+                Order.seller_hold_until <= func.now(),
                 Order.buyer_confirmed_at.is_(None)  # לא אושר מוקדם
             )
-        )
+        ).order_by(Order.seller_hold_until).limit(limit).with_for_update(skip_locked=True)
         result = await self.session.execute(stmt)
-        return [row[0] for row in result.fetchall()]
+        return list(result.scalars().all())
     
     # === Statistics & Analytics ===
     
@@ -619,35 +1125,25 @@ class WalletService:
         if not wallet:
             return {}
         
-        # סה"כ הכנסות ויציאות
-        stmt_income = select(Transaction).where(
-            and_(
-                Transaction.wallet_id == wallet.id,
-                Transaction.type.in_([
-                    TransactionType.DEPOSIT,
-                    TransactionType.SALE_CREDIT,
-                    TransactionType.REFUND,
-                    TransactionType.HOLD_RELEASE
-                ])
+        # סה"כ הכנסות ויציאות - הסכימה מתבצעת במסד, שורה אחת חוזרת
+        stmt = select(
+            func.coalesce(
+                func.sum(Transaction.amount).filter(Transaction.type.in_(_INCOME_TYPES)),
+                _ZERO
+            ),
+            func.coalesce(
+                func.sum(Transaction.amount).filter(Transaction.type.in_(_EXPENSE_TYPES)),
+                _ZERO
             )
-        )
-        
-        stmt_expenses = select(Transaction).where(
+        ).where(
             and_(
                 Transaction.wallet_id == wallet.id,
-                Transaction.type.in_([
-                    TransactionType.PURCHASE_DEBIT,
-                    TransactionType.WITHDRAWAL,
-                    TransactionType.FEE_DEBIT
-                ])
+                Transaction.type.in_(_INCOME_TYPES + _EXPENSE_TYPES)
             )
         )
         
-        income_result = await self.session.execute(stmt_income)
-        expense_result = await self.session.execute(stmt_expenses)
-        
-        total_income = sum(t.amount for t in income_result.scalars())
-        total_expenses = sum(t.amount for t in expense_result.scalars())
+        result = await self.session.execute(stmt)
+        total_income, total_expenses = result.one()
         
         return {
             "current_balance": wallet.total_balance,
@@ -7,23 +7,27 @@
 import asyncio
 import logging
 import logging.config
+import re
 import signal
 import sys
 from contextlib import asynccontextmanager
-from typing import Optional
+from typing import Callable, Optional
 
 # Third party imports
 from telegram import Bot
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler
+from telegram.ext import Application, CallbackQueryHandler
 import uvicorn
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from sqlalchemy import select, func
 
 # Local imports
 from app.config import settings, LOGGING_CONFIG
-from app.database import init_database, close_database, health_check
-from app.models.coupon import initialize_default_categories
+from app.database import db_manager, init_database, close_database, health_check
+from app.models.coupon import CouponCategory, default_categories_insert, default_category_rows
 from app.scheduler.tasks import start_scheduler, stop_scheduler
+from app.services.redis_client import close_redis_client
+from app.bot.keyboards import MainMenuKeyboards
 from app.bot.handlers.main import (
     get_main_conversation_handler,
     MenuHandlers,
@@ -33,14 +37,104 @@ from app.bot.handlers.main import (
     error_handler
 )
 
-# Configure logging
-logging.config.dictConfig(LOGGING_CONFIG)
 logger = logging.getLogger(__name__)
 
 
+def _configure_logging_once() -> None:
+    """
+    הגדרת הלוגים פעם אחת לתהליך (נקרא מנקודות הכניסה, לא בזמן import).
+    אם ל-root logger כבר יש handlers (למשל uvicorn / pytest) - לא מוסיפים עוד
+    """
+    if logging.getLogger().handlers:
+        return
+    
+    logging.config.dictConfig(LOGGING_CONFIG)
+
+
+# תבניות callback_data - מקומפלות פעם אחת בטעינת המודול
+ROLE_MENU_PATTERN = re.compile(r'^(buyer|seller|admin)_menu$', re.ASCII)
+WALLET_MENU_PATTERN = re.compile(r'^wallet_menu$', re.ASCII)
+ADD_BALANCE_PATTERN = re.compile(r'^add_balance$', re.ASCII)
+REFRESH_BALANCE_PATTERN = re.compile(r'^refresh_balance$', re.ASCII)
+BROWSE_COUPONS_PATTERN = re.compile(r'^browse_coupons$', re.ASCII)
+CATEGORY_PATTERN = re.compile(r'^category_', re.ASCII)
+CONTACT_SUPPORT_PATTERN = re.compile(r'^contact_support$', re.ASCII)
+TERMS_POLICY_PATTERN = re.compile(r'^terms_policy$', re.ASCII)
+BACK_TO_MAIN_PATTERN = re.compile(r'^back_to_main$', re.ASCII)
+BACK_PATTERN = re.compile(r'^back_', re.ASCII)
+
+# handlers סטטיים של כפתורים (callback, pattern), לפי סדר הרישום
+_CALLBACKS: tuple[tuple[Callable, re.Pattern], ...] = (
+    # Wallet handlers
+    (WalletHandlers.wallet_menu_callback, WALLET_MENU_PATTERN),
+    (WalletHandlers.add_balance_callback, ADD_BALANCE_PATTERN),
+    (WalletHandlers.refresh_balance_callback, REFRESH_BALANCE_PATTERN),
+    # Coupon handlers
+    (CouponHandlers.browse_coupons_callback, BROWSE_COUPONS_PATTERN),
+    (CouponHandlers.category_callback, CATEGORY_PATTERN),
+    # System handlers
+    (SystemHandlers.contact_support_callback, CONTACT_SUPPORT_PATTERN),
+    (SystemHandlers.terms_policy_callback, TERMS_POLICY_PATTERN),
+    # Back navigation - לפני ה-handler הכללי של ^back_
+    (MenuHandlers.buyer_menu_callback, BACK_TO_MAIN_PATTERN),
+)
+
+# זמן מקסימלי לכל שלב בעצירת הבוט (updater / application / shutdown)
+BOT_STOP_TIMEOUT_SECONDS = 5.0
+
+# מרווח רענון בדיקת בריאות ה-DB עבור /health
+HEALTH_REFRESH_SECONDS = 1.0
+
+# סוגי העדכונים שהבוט מבקש מטלגרם
+_ALLOWED_UPDATES: tuple[str, ...] = ('message', 'callback_query')
+
+
+def _install_uvloop() -> bool:
+    """
+    התקנת uvloop כ-event loop policy (לפני asyncio.run).
+    לא זמין ב-Windows או בלי החבילה - נשארים עם ה-loop הרגיל של asyncio
+    """
+    if sys.platform == 'win32':
+        return False
+    
+    try:
+        import uvloop
+    except ImportError:
+        logger.info("uvloop not installed, using default asyncio loop")
+        return False
+    
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    logger.info("⚡ uvloop event loop installed")
+    return True
+
+
+async def seed_default_categories() -> None:
+    """
+    הכנסת קטגוריות ברירת המחדל ב-INSERT מרובה שורות אחד.
+    בהפעלה רגילה הקטגוריות כבר קיימות - COUNT אחד ומדלגים.
+    ON CONFLICT DO NOTHING - workers שמתחילים במקביל לא נכשלים זה על זה
+    """
+    rows = default_category_rows()
+    
+    async with db_manager.get_session() as session:
+        existing = await session.scalar(select(func.count()).select_from(CouponCategory))
+        if existing >= len(rows):
+            return
+        
+        await session.execute(default_categories_insert(rows))
+        await session.commit()
+
+
 class TelegramBot:
     """מנהל בוט הטלגרם"""
     
+    # תפריט ראשי לכל תפקיד (role -> callback)
+    _ROLE_MENUS = {
+        'BUYER': MenuHandlers.buyer_menu_callback,
+        'SELLER': MenuHandlers.seller_menu_callback,
+        'ADMIN': MenuHandlers.admin_menu_callback,
+    }
+    
     def __init__(self):
         self.application: Optional[Application] = None
         self.bot: Optional[Bot] = None
@@ -72,64 +166,20 @@ class TelegramBot:
         # Main conversation handler
         app.add_handler(get_main_conversation_handler())
         
-        # Menu handlers  
-        app.add_handler(CallbackQueryHandler(
-            MenuHandlers.buyer_menu_callback, 
-            pattern='^buyer_menu$'
-        ))
-        app.add_handler(CallbackQueryHandler(
-            MenuHandlers.seller_menu_callback,
-            pattern='^seller_menu$'
-        ))
-        app.add_handler(CallbackQueryHandler(
-            MenuHandlers.admin_menu_callback,
-            pattern='^admin_menu$'
-        ))
-        
-        # Wallet handlers
-        app.add_handler(CallbackQueryHandler(
-            WalletHandlers.wallet_menu_callback,
-            pattern='^wallet_menu$'
-        ))
-        app.add_handler(CallbackQueryHandler(
-            WalletHandlers.add_balance_callback,
-            pattern='^add_balance$'
-        ))
-        app.add_handler(CallbackQueryHandler(
-            WalletHandlers.refresh_balance_callback,
-            pattern='^refresh_balance$'
-        ))
-        
-        # Coupon handlers
-        app.add_handler(CallbackQueryHandler(
-            CouponHandlers.browse_coupons_callback,
-            pattern='^browse_coupons$'
-        ))
-        app.add_handler(CallbackQueryHandler(
-            CouponHandlers.category_callback,
-            pattern='^category_'
-        ))
-        
-        # System handlers
+        # Menu handlers (buyer_menu / seller_menu / admin_menu)
         app.add_handler(CallbackQueryHandler(
-            SystemHandlers.contact_support_callback,
-            pattern='^contact_support$'
-        ))
-        app.add_handler(CallbackQueryHandler(
-            SystemHandlers.terms_policy_callback,
-            pattern='^terms_policy$'
+            self._handle_role_menu,
+            pattern=ROLE_MENU_PATTERN
         ))
         
-        # Back navigation handlers
-        app.add_handler(CallbackQueryHandler(
-            MenuHandlers.buyer_menu_callback,
-            pattern='^back_to_main$'
-        ))
+        # Wallet / coupon / system / back-to-main handlers
+        for callback, pattern in _CALLBACKS:
+            app.add_handler(CallbackQueryHandler(callback, pattern=pattern))
         
         # Generic back handlers based on user role
         app.add_handler(CallbackQueryHandler(
             self._handle_back_navigation,
-            pattern='^back_'
+            pattern=BACK_PATTERN
         ))
         
         # Unknown callback handler (fallback)
@@ -142,21 +192,21 @@ class TelegramBot:
         
         logger.info("📋 Bot handlers registered")
     
+    async def _handle_role_menu(self, update, context):
+        """תפריט לפי תפקיד - התפקיד נלקח מה-callback_data (<role>_menu)"""
+        role = context.matches[0].group(1).upper()
+        await self._ROLE_MENUS[role](update, context)
+    
     async def _handle_back_navigation(self, update, context):
         """טיפול בניווט חזרה דינאמי"""
         query = update.callback_query
         await query.answer()
         
-        user_role = context.user_data.get('role')
+        menu_callback = self._ROLE_MENUS.get(context.user_data.get('role'))
         
-        if user_role == 'BUYER':
-            await MenuHandlers.buyer_menu_callback(update, context)
-        elif user_role == 'SELLER':
-            await MenuHandlers.seller_menu_callback(update, context)
-        elif user_role == 'ADMIN':
-            await MenuHandlers.admin_menu_callback(update, context)
+        if menu_callback:
+            await menu_callback(update, context)
         else:
-            from app.bot.keyboards import MainMenuKeyboards
             keyboard = MainMenuKeyboards.get_role_selection()
             await query.edit_message_text(
                 "🏠 בחר תפקיד:",
@@ -172,9 +222,13 @@ class TelegramBot:
         
         await self.application.initialize()
         await self.application.start()
+        # long polling: טלגרם מחזיק את getUpdates עד 30 שניות במקום לחזור ריק כל 10
         await self.application.updater.start_polling(
             drop_pending_updates=True,
-            allowed_updates=['message', 'callback_query']
+            allowed_updates=_ALLOWED_UPDATES,
+            timeout=30,
+            poll_interval=0.0,
+            bootstrap_retries=-1
         )
         
         self._running = True
@@ -185,9 +239,16 @@ class TelegramBot:
         if self.application and self._running:
             logger.info("🔒 Stopping Telegram bot...")
             
-            await self.application.updater.stop()
-            await self.application.stop()
-            await self.application.shutdown()
+            # כל שלב חסום בזמן, כך ששלב תקוע לא מעכב את שאר הכיבוי
+            for step in (
+                self.application.updater.stop,
+                self.application.stop,
+                self.application.shutdown,
+            ):
+                try:
+                    await asyncio.wait_for(step(), timeout=BOT_STOP_TIMEOUT_SECONDS)
+                except asyncio.TimeoutError:
+                    logger.warning(f"Telegram bot {step.__qualname__} timed out after {BOT_STOP_TIMEOUT_SECONDS}s")
             
             self._running = False
             logger.info("✅ Telegram bot stopped")
@@ -198,8 +259,16 @@ class WebAPI:
     
     def __init__(self, telegram_bot: TelegramBot):
         self.telegram_bot = telegram_bot
+        # תוצאת בדיקת ה-DB האחרונה - /health מחזיר אותה במקום לפנות למסד בכל בקשה
+        self._last_health: Optional[dict] = None
         self.app = self._create_app()
     
+    async def _health_refresher(self) -> None:
+        """רענון בדיקת בריאות ה-DB ברקע, פעם ב-HEALTH_REFRESH_SECONDS"""
+        while True:
+            self._last_health = await health_check()
+            await asyncio.sleep(HEALTH_REFRESH_SECONDS)
+    
     def _create_app(self) -> FastAPI:
         """יצירת FastAPI application"""
         
@@ -211,24 +280,24 @@ class WebAPI:
             await init_database()
             
             try:
-                from app.database import db_manager
-                async with db_manager.get_session() as session:
-                    categories = initialize_default_categories()
-                    for category in categories:
-                        session.add(category)
-                    await session.commit()
-                    logger.info("📂 Default categories initialized")
+                await seed_default_categories()
+                logger.info("📂 Default categories initialized")
             except Exception as e:
                 logger.warning(f"Categories initialization warning: {e}")
             
             if self.telegram_bot.bot:
                 await start_scheduler(self.telegram_bot.bot)
             
+            health_task = asyncio.create_task(self._health_refresher(), name="health-refresher")
+            
             yield
             
             # Shutdown
             logger.info("🔒 FastAPI shutting down...")
+            health_task.cancel()
+            await asyncio.gather(health_task, return_exceptions=True)
             await stop_scheduler()
+            await close_redis_client()
             await close_database()
         
         app = FastAPI(
@@ -248,7 +317,10 @@ class WebAPI:
         
         @app.get("/health")
         async def health_endpoint():
-            db_health = await health_check()
+            db_health = self._last_health
+            if db_health is None:
+                # לפני הרענון הראשון
+                db_health = await health_check()
             
             return {
                 "status": "healthy" if db_health["healthy"] else "unhealthy",
@@ -276,15 +348,30 @@ class WebAPI:
         logger.info("📡 FastAPI app created")
         return app
     
-    def run(self, host: str = None, port: int = None):
+    def run(self, host: str = None, port: int = None, workers: int = 1):
+        """
+        הרצת השרת. עם כמה workers כל תהליך בונה את האפליקציה בעצמו
+        דרך web_api_app_factory (uvicorn דורש import string במצב הזה)
+        """
+        app = "main:web_api_app_factory" if workers > 1 else self.app
         uvicorn.run(
-            self.app,
+            app,
+            factory=workers > 1,
+            workers=workers,
             host=host or settings.HOST,
             port=port or settings.PORT,
+            loop="auto",  # uvloop כשמותקן, אחרת asyncio
+            http="httptools",  # parser ב-C במקום h11
             log_config=None
         )
 
 
+def web_api_app_factory() -> FastAPI:
+    """FastAPI ללא בוט פעיל - לכל worker של uvicorn במצב API בלבד"""
+    _configure_logging_once()
+    return WebAPI(TelegramBot()).app
+
+
 class MarketplaceApp:
     """האפליקציה הראשית"""
     
@@ -292,44 +379,61 @@ class MarketplaceApp:
         self.telegram_bot = TelegramBot()
         self.web_api = WebAPI(self.telegram_bot)
         self._shutdown_event = asyncio.Event()
-        
-        if sys.platform != 'win32':
-            signal.signal(signal.SIGTERM, self._signal_handler)
-            signal.signal(signal.SIGINT, self._signal_handler)
     
-    def _signal_handler(self, signum, frame):
+    def _install_signal_handlers(self) -> None:
+        """
+        רישום SIGTERM / SIGINT על ה-event loop עצמו (add_signal_handler),
+        כך שהאות מעיר את ה-loop מיד. לא נתמך ב-Windows
+        """
+        if sys.platform == 'win32':
+            return
+        
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, self._handle_signal, sig)
+    
+    def _handle_signal(self, signum) -> None:
         logger.info(f"📡 Received signal {signum}")
         self._shutdown_event.set()
     
+    async def _init_categories(self) -> None:
+        """קטגוריות ברירת מחדל (כשל לא עוצר את ההפעלה)"""
+        try:
+            await seed_default_categories()
+            logger.info("📂 Categories initialized")
+        except Exception as e:
+            logger.warning(f"Categories init warning: {e}")
+    
+    async def _start_bot_and_scheduler(self) -> None:
+        """הפעלת הבוט ואחריו המתזמן (שצריך את ה-bot להתראות)"""
+        await self.telegram_bot.start()
+        
+        if self.telegram_bot.bot:
+            await start_scheduler(self.telegram_bot.bot)
+    
     async def run_bot_only(self):
         """הרצת בוט בלבד (למודים production)"""
         try:
             logger.info("🤖 Starting bot-only mode...")
             
-            await init_database()
+            self._install_signal_handlers()
             
-            try:
-                from app.database import db_manager
-                async with db_manager.get_session() as session:
-                    categories = initialize_default_categories()
-                    for category in categories:
-                        session.add(category)
-                    await session.commit()
-                    logger.info("📂 Categories initialized")
-            except Exception as e:
-                logger.warning(f"Categories init warning: {e}")
+            await init_database()
             
-            await self.telegram_bot.start()
-            
-            if self.telegram_bot.bot:
-                await start_scheduler(self.telegram_bot.bot)
+            # הקטגוריות והבוט לא תלויים זה בזה - במקביל; המתזמן צריך בוט פעיל
+            async with asyncio.TaskGroup() as tg:
+                tg.create_task(self._init_categories())
+                tg.create_task(self._start_bot_and_scheduler())
             
             logger.info(f"🎉 {settings.APP_NAME} v{settings.VERSION} is running!")
             
             await self._shutdown_event.wait()
             
         except Exception as e:
-            logger.error(f"❌ Application failed: {e}")
+            # כשל בתוך ה-TaskGroup מגיע כ-ExceptionGroup - רישום כל כשל בנפרד, עם traceback
+            errors = e.exceptions if isinstance(e, ExceptionGroup) else (e,)
+            for error in errors:
+                logger.error(f"❌ Application failed: {error}", exc_info=error)
             raise
         
         finally:
@@ -360,6 +464,7 @@ class MarketplaceApp:
         try:
             await stop_scheduler()
             await self.telegram_bot.stop()
+            await close_redis_client()
             await close_database()
             
             logger.info("✅ Application shutdown complete")
@@ -380,12 +485,25 @@ async def run_with_api():
     await app.run_with_api()
 
 
+def run_api_only():
+    """
+    API בלבד, עם WEB_CONCURRENCY תהליכים.
+    הבוט (והמשימות המתוזמנות) לא רצים כאן - הם נשארים בתהליך יחיד (python main.py)
+    """
+    logger.info(f"🌐 Starting API-only mode ({settings.WEB_CONCURRENCY} workers)...")
+    WebAPI(TelegramBot()).run(workers=settings.WEB_CONCURRENCY)
+
+
 def main():
     """נקודת כניסה ראשית"""
+    _configure_logging_once()
+    
     logger.info(f"🚀 Starting {settings.APP_NAME} v{settings.VERSION}")
     logger.info(f"📍 Environment: {settings.ENVIRONMENT}")
     logger.info(f"🗄️ Database configured")
     
+    _install_uvloop()
+    
     try:
         if len(sys.argv) > 1 and sys.argv[1] == "api":
             asyncio.run(run_with_api())
@@ -422,14 +540,8 @@ async def init_categories():
     """אתחול קטגוריות בלבד"""
     try:
         await init_database()
+        await seed_default_categories()
         
-        from app.database import db_manager
-        async with db_manager.get_session() as session:
-            categories = initialize_default_categories()
-            for category in categories:
-                session.add(category)
-            await session.commit()
-            
         logger.info("✅ Categories initialized successfully")
         await close_database()
         
@@ -438,6 +550,8 @@ async def init_categories():
 
 
 if __name__ == "__main__":
+    _configure_logging_once()
+    
     if len(sys.argv) > 1:
         command = sys.argv[1]
         
@@ -447,10 +561,13 @@ if __name__ == "__main__":
             asyncio.run(init_categories())
         elif command == "api":
             main()
+        elif command == "web":
+            run_api_only()
         else:
             print("Available commands:")
             print("  python main.py          - Run bot only")
             print("  python main.py api      - Run with FastAPI")  
+            print("  python main.py web      - Run FastAPI only (WEB_CONCURRENCY workers)")
             print("  python main.py test-db  - Test database connection")
             print("  python main.py init-categories - Initialize categories")
     else:
@@ -0,0 +1,27 @@
+import re
+
+from sqlalchemy.dialects import postgresql
+
+# ייבוא כל המודלים כדי שהמיפויים (relationships) ייפתרו
+import app.models.order  # noqa: F401
+import app.models.user  # noqa: F401
+from app.models.coupon import CouponCategory, default_categories_insert
+
+
+def test_default_categories_insert_covers_required_columns():
+    """
+    INSERT ב-Core לא מפעיל default_factory של ה-dataclass - כל עמודת NOT NULL
+    בלי ברירת מחדל (Core או server) חייבת להופיע בשורות עצמן
+    """
+    sql = str(default_categories_insert().compile(dialect=postgresql.dialect()))
+    column_list = re.match(r"INSERT INTO coupon_categories \(([^)]*)\)", sql).group(1)
+    inserted = {name.strip() for name in column_list.split(",")}
+
+    required = {
+        column.name
+        for column in CouponCategory.__table__.columns
+        if not column.nullable and column.default is None and column.server_default is None
+    }
+
+    assert required, "מצופה לפחות לעמודות הזמן ולמפתח"
+    assert required <= inserted, f"עמודות חובה חסרות ב-INSERT: {sorted(required - inserted)}"
@@ -0,0 +1,88 @@
+import pytest
+from sqlalchemy.orm import configure_mappers
+
+# ייבוא כל המודלים כדי שהמיפויים (relationships) ייפתרו
+import app.models.coupon  # noqa: F401
+import app.models.order  # noqa: F401
+from app.models.user import Transaction
+from app.services.idempotency import OperationInProgressError, idempotent
+
+
+def _transaction(id):
+    """Transaction בלי הבנאי (שדורש את כל הקשרים) - מספיק מזהה"""
+    configure_mappers()
+    transaction = Transaction.__mapper__.class_manager.new_instance()
+    transaction.id = id
+    return transaction
+
+
+class _Service:
+    def __init__(self, redis, session):
+        self.redis = redis
+        self.session = session
+        self.calls = 0
+
+    @idempotent("purchase", key_arg="order_id")
+    async def charge(self, order_id):
+        self.calls += 1
+        row = _transaction(f"tx-{self.calls}")
+        self.session.rows[(Transaction, row.id)] = row
+        return row, None
+
+
+async def test_retry_after_commit_replays_stored_result(fake_redis, fake_session):
+    service = _Service(fake_redis, fake_session)
+
+    first = await service.charge("order-1")
+    await service.session.commit()
+    retry = await service.charge(order_id="order-1")
+
+    assert service.calls == 1
+    assert retry == first
+
+
+async def test_retry_before_commit_does_not_charge_again(fake_redis, fake_session):
+    service = _Service(fake_redis, fake_session)
+    await service.charge("order-1")
+
+    # הטרנזקציה הראשונה עוד לא הסתיימה - המפתח עדיין pending
+    with pytest.raises(OperationInProgressError):
+        await service.charge("order-1")
+
+    assert service.calls == 1
+
+
+async def test_rollback_releases_key_for_retry(fake_redis, fake_session):
+    service = _Service(fake_redis, fake_session)
+    await service.charge("order-1")
+    await service.session.rollback()
+
+    await service.charge("order-1")
+
+    assert service.calls == 2
+
+
+async def test_savepoint_rollback_releases_key_even_if_outer_commits(fake_redis, fake_session):
+    service = _Service(fake_redis, fake_session)
+
+    # כמו _finalize_auction: החיוב בתוך savepoint שנכשל, והטרנזקציה החיצונית ממשיכה
+    savepoint = service.session.sync_session.begin_nested()
+    await service.charge("order-1")
+    savepoint.rollback()
+    await service.session.commit()
+
+    await service.charge("order-1")
+
+    assert service.calls == 2
+
+
+async def test_savepoint_commit_keeps_key_until_outer_commit(fake_redis, fake_session):
+    service = _Service(fake_redis, fake_session)
+
+    savepoint = service.session.sync_session.begin_nested()
+    first = await service.charge("order-1")
+    savepoint.commit()
+    await service.session.commit()
+
+    assert await service.charge("order-1") == first
+    assert service.calls == 1
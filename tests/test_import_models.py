@@ -1,11 +1,21 @@
 import importlib
 import pkgutil
-from typing import List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
 
 import pytest
 from sqlalchemy.orm import configure_mappers
 
 
+def _safe_import(module_name: str) -> Tuple[str, Optional[Exception]]:
+    """ייבוא מודול יחיד; מחזיר את החריגה במקום לזרוק אותה"""
+    try:
+        importlib.import_module(module_name)
+        return module_name, None
+    except Exception as exc:  # noqa: BLE001 - חשוב לתפוס הכל כדי לדווח
+        return module_name, exc
+
+
 def _import_all_submodules(package_name: str) -> List[str]:
     """מייבא את כל תתי המודולים תחת חבילה נתונה ומחזיר את שמותיהם.
 
@@ -13,17 +23,19 @@ def _import_all_submodules(package_name: str) -> List[str]:
     """
     package = importlib.import_module(package_name)
 
-    imported_module_names: List[str] = []
-    failures: List[Tuple[str, Exception]] = []
-
-    # הליכה רקורסיבית על כל המודולים תחת החבילה
-    for module_info in pkgutil.walk_packages(package.__path__, package.__name__ + "."):
-        module_name = module_info.name
-        try:
-            importlib.import_module(module_name)
-            imported_module_names.append(module_name)
-        except Exception as exc:  # noqa: BLE001 - חשוב לתפוס הכל כדי לדווח
-            failures.append((module_name, exc))
+    # הליכה רקורסיבית על כל המודולים תחת החבילה, וייבוא מקבילי
+    # (מנגנון הייבוא thread-safe - נעילה לכל מודול)
+    names = [
+        module_info.name
+        for module_info in pkgutil.walk_packages(package.__path__, package.__name__ + ".")
+    ]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(_safe_import, names))
+
+    imported_module_names: List[str] = [name for name, exc in results if exc is None]
+    failures: List[Tuple[str, Exception]] = [
+        (name, exc) for name, exc in results if exc is not None
+    ]
 
     if failures:
         details = "\n".join(
@@ -1,10 +1,17 @@
-from app.scheduler.tasks import SchedulerService
+import asyncio
+
+from app.scheduler.tasks import (
+    AUCTION_FINALIZE_CONCURRENCY,
+    SWEEP_INTERVAL_MINUTES,
+    AdminReporter,
+    SchedulerService,
+)
 
 
 def test_scheduler_service_has_required_methods():
     service = SchedulerService()
 
-    required_methods = [
+    required_methods = frozenset([
         'check_urgent_tasks',
         'release_expired_holds',
         'finalize_ended_auctions',
@@ -12,27 +19,172 @@ def test_scheduler_service_has_required_methods():
         'cleanup_tasks',
         'daily_tasks',
         '_add_scheduled_jobs',
-        '_check_ending_auctions_soon',
+        '_process_auction_deadlines',
         '_check_dispute_windows_closing',
         '_finalize_auction',
+        '_finalize_auction_by_id',
+        '_finalize_auctions_concurrently',
+        'schedule_auction_finalization',
+        '_release_hold_by_id',
+        '_release_order_hold',
+        'schedule_hold_release',
+        '_schedule_upcoming_hold_releases',
         '_send_price_drop_notifications',
         '_send_expiry_notifications',
         '_send_favorite_notifications',
         '_cleanup_expired_coupons',
         '_update_seller_daily_quotas',
+        '_relax_commit_durability',
         '_generate_daily_reports',
         '_send_telegram_notification',
+        '_resolve_chat_ids',
+        '_send_to_chat',
         '_send_admin_notification',
+        '_flush_admin_reports',
         '_is_seller_verified',
+        'invalidate_seller',
         '_notify_auction_ending_soon',
         '_send_dispute_window_reminder',
         '_notify_seller_payment_released',
         '_notify_auction_winner',
         '_notify_auction_losers',
+        '_notify_sellers_coupons_expired',
         '_cleanup_old_transactions',
         '_cleanup_old_data',
         '_backup_important_data',
-    ]
+    ])
+
+    available = set(dir(service))
+    missing = required_methods.difference(available)
+    assert not missing, f"SchedulerService missing methods: {sorted(missing)}"
+
+
+class _CountingSession:
+    """session מזויף שסופר שאילתות ומחזיר תמיד מוכר מאומת"""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def execute(self, stmt, params=None):
+        self.calls += 1
+        return self
+
+    def scalar_one_or_none(self):
+        return True
+
+
+async def test_is_seller_verified_is_cached_until_invalidated():
+    service = SchedulerService()
+    session = _CountingSession()
+
+    assert await service._is_seller_verified(session, 42) is True
+    assert await service._is_seller_verified(session, 42) is True
+    assert session.calls == 1
+
+    service.invalidate_seller(42)
+    assert await service._is_seller_verified(session, 42) is True
+    assert session.calls == 2
+
+
+async def test_scheduled_jobs_are_staggered():
+    service = SchedulerService()
+    service.setup_scheduler()
+    await service._add_scheduled_jobs()
+
+    jobs = {job.id: job for job in service.scheduler.get_jobs()}
+    interval_ids = ['urgent_tasks', 'release_holds', 'notifications', 'cleanup']
+    first_runs = [jobs[job_id].next_run_time for job_id in interval_ids]
+
+    assert len(set(first_runs)) == len(interval_ids)
+    assert all(jobs[job_id].trigger.jitter for job_id in interval_ids)
+
+
+async def test_auction_finalization_is_scheduled_as_date_job():
+    from datetime import datetime, timedelta, timezone
+
+    service = SchedulerService()
+    service.setup_scheduler()
+    service.scheduler.start(paused=True)
+
+    ends_at = datetime.now(timezone.utc) + timedelta(hours=1)
+    service.schedule_auction_finalization('a1', ends_at)
+    service.schedule_auction_finalization('a1', ends_at + timedelta(minutes=10))
+
+    jobs = [job for job in service.scheduler.get_jobs() if job.id == 'finalize:a1']
+    assert len(jobs) == 1
+    assert jobs[0].trigger.run_date == ends_at + timedelta(minutes=10)
+
+    service.scheduler.shutdown(wait=False)
+
+
+class _UpcomingHoldsSession:
+    """session מזויף שמחזיר holds קרובים ושומר את הפרמטרים של השאילתה"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.params = None
+
+    async def execute(self, stmt, params=None):
+        self.params = params
+        return self
+
+    def all(self):
+        return self.rows
+
+
+async def test_hold_sweep_schedules_date_jobs_for_upcoming_holds():
+    from datetime import datetime, timedelta, timezone
+
+    service = SchedulerService()
+    service.setup_scheduler()
+    service.scheduler.start(paused=True)
+
+    now = datetime.now(timezone.utc)
+    hold_until = now + timedelta(minutes=3)
+    session = _UpcomingHoldsSession([('o1', hold_until)])
+
+    await service._schedule_upcoming_hold_releases(session, now)
+    await service._schedule_upcoming_hold_releases(session, now)
+
+    assert session.params['soon'] - now >= timedelta(minutes=SWEEP_INTERVAL_MINUTES)
+    jobs = [job for job in service.scheduler.get_jobs() if job.id == 'release_hold:o1']
+    assert len(jobs) == 1
+    assert jobs[0].trigger.run_date == hold_until
+
+    service.scheduler.shutdown(wait=False)
+
+
+def test_admin_reporter_coalesces_tick_messages():
+    reporter = AdminReporter()
+    assert not reporter
+
+    reporter.add("first")
+    reporter.add("second")
+
+    assert reporter.drain() == ["first\n\nsecond"]
+    assert not reporter
+
+
+async def test_auction_finalization_concurrency_is_bounded():
+    from datetime import datetime, timezone
+
+    service = SchedulerService()
+    running = 0
+    peak = 0
+    finalized = []
+
+    async def fake_finalize(auction_id, now=None):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        finalized.append(auction_id)
+        running -= 1
+
+    service._finalize_auction_by_id = fake_finalize
+    auction_ids = [str(i) for i in range(3 * AUCTION_FINALIZE_CONCURRENCY)]
+
+    await service._finalize_auctions_concurrently(auction_ids, datetime.now(timezone.utc))
 
-    for name in required_methods:
-        assert hasattr(service, name), f"SchedulerService missing method: {name}"
\ No newline at end of file
+    assert sorted(finalized) == sorted(auction_ids)
+    assert peak == AUCTION_FINALIZE_CONCURRENCY
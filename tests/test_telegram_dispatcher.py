@@ -0,0 +1,70 @@
+import asyncio
+
+from telegram.error import RetryAfter
+
+from app.services import telegram_dispatcher
+from app.services.telegram_dispatcher import TelegramDispatcher
+
+
+class _FakeBot:
+    """בוט מזויף שמחזיר flood control בפעם הראשונה ואז מצליח"""
+
+    def __init__(self, fail_first: bool = False):
+        self.sent = []
+        self._fail_next = fail_first
+
+    async def send_message(self, chat_id, text):
+        if self._fail_next:
+            self._fail_next = False
+            raise RetryAfter(0)
+        self.sent.append((chat_id, text))
+
+
+async def test_dispatcher_sends_enqueued_messages():
+    bot = _FakeBot()
+    dispatcher = TelegramDispatcher(rate_per_second=100, concurrency=2)
+    await dispatcher.start(bot)
+
+    await dispatcher.enqueue(1, "a")
+    await dispatcher.enqueue(2, "b")
+    await dispatcher.stop()
+
+    assert sorted(bot.sent) == [(1, "a"), (2, "b")]
+    assert not dispatcher.is_running
+
+
+async def test_dispatcher_requeues_after_retry_after():
+    bot = _FakeBot(fail_first=True)
+    dispatcher = TelegramDispatcher(rate_per_second=100, concurrency=1)
+    await dispatcher.start(bot)
+
+    await dispatcher.enqueue(7, "retry me")
+    await asyncio.wait_for(dispatcher._queue.join(), timeout=2)
+    await dispatcher.stop()
+
+    assert bot.sent == [(7, "retry me")]
+
+
+async def test_worker_survives_fetch_error(monkeypatch):
+    monkeypatch.setattr(telegram_dispatcher, "FETCH_ERROR_BACKOFF_SECONDS", 0)
+    bot = _FakeBot()
+    dispatcher = TelegramDispatcher(rate_per_second=100, concurrency=1)
+
+    next_message = dispatcher._next_message
+    failures = []
+
+    async def flaky_next_message():
+        if not failures:
+            failures.append(True)
+            raise ConnectionError("redis went away")
+        return await next_message()
+
+    dispatcher._next_message = flaky_next_message
+    await dispatcher.start(bot)
+
+    await dispatcher.enqueue(3, "after failure")
+    await asyncio.wait_for(dispatcher._queue.join(), timeout=2)
+    await dispatcher.stop()
+
+    assert failures == [True]
+    assert bot.sent == [(3, "after failure")]
@@ -41,7 +41,7 @@ def test_create_user_minimal_seller() -> None:
     assert len(user.fund_locks) == 0
 
 
-@pytest.mark.asyncio
+@pytest.mark.asyncio(loop_scope="session")
 async def test_user_gets_id_after_flush(async_session):
     user = User(
         telegram_user_id=1234567890,
@@ -54,7 +54,7 @@ async def test_user_gets_id_after_flush(async_session):
     assert user.id is not None
 
 
-@pytest.mark.asyncio
+@pytest.mark.asyncio(loop_scope="session")
 async def test_wallet_creation(async_session):
     user = User(
         telegram_user_id=1234567891,
@@ -62,18 +62,16 @@ async def test_wallet_creation(async_session):
         first_name="Wallet",
         last_name="User",
     )
-    async_session.add(user)
+    wallet = Wallet(user=user, transactions=[], fund_locks=[])
+    async_session.add_all([user, wallet])
     await async_session.flush()
 
     assert user.id is not None
-    wallet = Wallet(user=user, transactions=[], fund_locks=[])
-    async_session.add(wallet)
-    await async_session.flush()
     assert wallet.id is not None
     assert wallet.user_id == user.id
 
 
-@pytest.mark.asyncio
+@pytest.mark.asyncio(loop_scope="session")
 async def test_seller_profile_creation(async_session):
     user = User(
         telegram_user_id=1234567892,
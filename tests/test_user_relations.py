@@ -3,7 +3,7 @@ import random
 from app.models.user import User, Wallet, SellerProfile
 
 
-@pytest.mark.asyncio
+@pytest.mark.asyncio(loop_scope="session")
 async def test_user_wallet_and_seller(async_session):
     # יצירת משתמש חדש
     user = User(
@@ -12,22 +12,17 @@ async def test_user_wallet_and_seller(async_session):
         first_name="Test",
         last_name="User",
     )
-    async_session.add(user)
-    await async_session.flush()
-    assert user.id is not None
 
-    # יצירת ארנק דרך relationship
+    # יצירת ארנק ופרופיל מוכר דרך relationship
     wallet = Wallet(user=user, transactions=[], fund_locks=[])
-    async_session.add(wallet)
-
-    # יצירת פרופיל מוכר דרך relationship
     seller = SellerProfile(user=user, business_name="Test Biz")
-    async_session.add(seller)
 
-    # flush למסד
+    # flush יחיד למסד - SQLAlchemy מסדר את ה-INSERTs לפי התלויות
+    async_session.add_all([user, wallet, seller])
     await async_session.flush()
 
     # בדיקות
+    assert user.id is not None
     assert wallet.id is not None
     assert wallet.user_id == user.id
     assert seller.id is not None
@@ -0,0 +1,267 @@
+import asyncio
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import func, select
+
+from app.config import settings
+from app.models.user import Transaction, TransactionType, User, Wallet
+from app.services.wallet_service import InsufficientFundsError, WalletService
+
+
+async def _create_user(session) -> int:
+    user = User(
+        telegram_user_id=random.randint(1_000_000_000, 10_000_000_000),
+        username="walletdb",
+        first_name="Wallet",
+        last_name="Test",
+    )
+    session.add(user)
+    await session.flush()
+    return user.id
+
+
+async def _balances(session, user_id):
+    """היתרות כפי שהן במסד (שאילתת עמודות - לא דרך ה-identity map)"""
+    result = await session.execute(
+        select(Wallet.total_balance, Wallet.locked_balance).where(Wallet.user_id == user_id)
+    )
+    return tuple(result.one())
+
+
+async def _funded_wallet(session, service, amount):
+    """משתמש חדש עם ארנק שהוטענה בו יתרה (ע"י אדמין חדש)"""
+    admin_id = await _create_user(session)
+    user_id = await _create_user(session)
+    await service.admin_add_balance(user_id, amount, "test", admin_id=admin_id)
+    return user_id, await service.get_wallet(user_id)
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_debit_updates_wallet_row_and_orm_object(async_session):
+    service = WalletService(async_session)
+    user_id, wallet = await _funded_wallet(async_session, service, Decimal("100.00"))
+
+    transaction = await service.create_transaction(
+        wallet, TransactionType.PURCHASE_DEBIT, Decimal("30.00"), "debit"
+    )
+
+    assert transaction.balance_before == Decimal("100.00")
+    assert transaction.balance_after == Decimal("70.00")
+    assert wallet.total_balance == Decimal("70.00")
+
+    # flush נוסף לא דורס את העדכון של ה-UPDATE בערכים ישנים מהאובייקט
+    await async_session.flush()
+    assert await _balances(async_session, user_id) == (wallet.total_balance, wallet.locked_balance)
+    assert await _balances(async_session, user_id) == (Decimal("70.00"), Decimal("0.00"))
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_insufficient_debit_is_refused(async_session):
+    service = WalletService(async_session)
+    user_id, wallet = await _funded_wallet(async_session, service, Decimal("10.00"))
+
+    with pytest.raises(InsufficientFundsError):
+        await service.create_transaction(
+            wallet, TransactionType.PURCHASE_DEBIT, Decimal("30.00"), "debit"
+        )
+
+    assert await _balances(async_session, user_id) == (Decimal("10.00"), Decimal("0.00"))
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_concurrent_debits_cannot_overdraw(initialized_db):
+    async with initialized_db.get_session() as session:
+        user_id, _ = await _funded_wallet(session, WalletService(session), Decimal("100.00"))
+
+    async def debit():
+        async with initialized_db.get_session() as session:
+            service = WalletService(session)
+            wallet = await service.get_wallet(user_id)
+            await service.create_transaction(
+                wallet, TransactionType.PURCHASE_DEBIT, Decimal("60.00"), "debit"
+            )
+            # שורת הארנק נשארת נעולה - החיוב השני ממתין ל-commit ובודק שוב את היתרה
+            await asyncio.sleep(0.2)
+
+    results = await asyncio.gather(debit(), debit(), return_exceptions=True)
+
+    assert sum(isinstance(result, InsufficientFundsError) for result in results) == 1
+    async with initialized_db.get_session() as session:
+        assert await _balances(session, user_id) == (Decimal("40.00"), Decimal("0.00"))
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_get_or_create_wallets_creates_only_missing(async_session):
+    service = WalletService(async_session)
+    existing_id, existing = await _funded_wallet(async_session, service, Decimal("5.00"))
+    new_id = await _create_user(async_session)
+
+    wallets = await service.get_or_create_wallets(existing_id, new_id)
+
+    assert wallets[existing_id].id == existing.id
+    assert wallets[new_id].user_id == new_id
+    count = await async_session.scalar(
+        select(func.count()).select_from(Wallet).where(Wallet.user_id.in_([existing_id, new_id]))
+    )
+    assert count == 2
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_release_fund_lock_returns_locked_balance_once(async_session):
+    service = WalletService(async_session)
+    user_id, _ = await _funded_wallet(async_session, service, Decimal("100.00"))
+    fund_lock = await service.create_fund_lock(
+        user_id, Decimal("40.00"), "bid", "auction", str(uuid.uuid4())
+    )
+    assert await _balances(async_session, user_id) == (Decimal("100.00"), Decimal("40.00"))
+
+    assert await service.release_fund_lock(fund_lock.id) is True
+    assert await service.release_fund_lock(fund_lock.id) is False
+    assert await _balances(async_session, user_id) == (Decimal("100.00"), Decimal("0.00"))
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_release_auction_losing_bids_keeps_winner_locked(async_session):
+    service = WalletService(async_session)
+    auction_id = str(uuid.uuid4())
+    winner_id, _ = await _funded_wallet(async_session, service, Decimal("100.00"))
+    loser_ids = [
+        (await _funded_wallet(async_session, service, Decimal("100.00")))[0] for _ in range(2)
+    ]
+    for user_id in [winner_id, *loser_ids]:
+        await service.create_fund_lock(user_id, Decimal("25.00"), "bid", "auction", auction_id)
+
+    assert await service.release_auction_losing_bids(auction_id, winner_id) == 2
+
+    assert await _balances(async_session, winner_id) == (Decimal("100.00"), Decimal("25.00"))
+    for user_id in loser_ids:
+        assert await _balances(async_session, user_id) == (Decimal("100.00"), Decimal("0.00"))
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_cleanup_expired_locks_releases_across_wallets(async_session):
+    service = WalletService(async_session)
+    expired = datetime.now(timezone.utc) - timedelta(minutes=1)
+    first_id, _ = await _funded_wallet(async_session, service, Decimal("100.00"))
+    second_id, _ = await _funded_wallet(async_session, service, Decimal("50.00"))
+
+    reference_id = str(uuid.uuid4())
+    for user_id, amount in [(first_id, "10.00"), (first_id, "15.00"), (second_id, "20.00")]:
+        await service.create_fund_lock(
+            user_id, Decimal(amount), "bid", "auction", reference_id, expires_at=expired
+        )
+    # נעילה שלא פגה נשארת
+    await service.create_fund_lock(first_id, Decimal("5.00"), "bid", "auction", reference_id)
+
+    assert await service.cleanup_expired_locks() >= 3
+
+    assert await _balances(async_session, first_id) == (Decimal("100.00"), Decimal("5.00"))
+    assert await _balances(async_session, second_id) == (Decimal("50.00"), Decimal("0.00"))
+
+    result = await async_session.execute(
+        select(Transaction).where(
+            Transaction.reference_id == reference_id,
+            Transaction.type == TransactionType.RELEASE
+        )
+    )
+    releases = result.scalars().all()
+    assert len(releases) == 3
+
+    # בכל ארנק - שרשרת רציפה של יתרה קפואה, והיתרה הכוללת לא משתנה
+    for user_id, total, locked_start, locked_end in [
+        (first_id, Decimal("100.00"), Decimal("30.00"), Decimal("5.00")),
+        (second_id, Decimal("50.00"), Decimal("20.00"), Decimal("0.00")),
+    ]:
+        chain = sorted(
+            (release for release in releases if release.user_id == user_id),
+            key=lambda release: release.locked_before,
+            reverse=True
+        )
+        assert all(release.balance_before == release.balance_after == total for release in chain)
+        assert chain[0].locked_before == locked_start
+        assert chain[-1].locked_after == locked_end
+        for previous, current in zip(chain, chain[1:]):
+            assert previous.locked_after == current.locked_before
+        for release in chain:
+            assert release.locked_before - release.locked_after == release.amount
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_python_purchase_and_full_refund_insert_ledger_rows(async_session, monkeypatch):
+    monkeypatch.setattr(settings, "WALLET_PURCHASE_DB_FUNCTION", False)
+    service = WalletService(async_session)
+    buyer_id, _ = await _funded_wallet(async_session, service, Decimal("200.00"))
+    seller_id = await _create_user(async_session)
+    admin_id = await _create_user(async_session)
+    order_id = str(uuid.uuid4())
+
+    buyer_tx, hold_tx = await service.process_purchase(buyer_id, seller_id, Decimal("100.00"), order_id)
+
+    assert buyer_tx.balance_after == Decimal("200.00") - buyer_tx.amount
+    assert hold_tx.locked_after == hold_tx.amount
+    assert await _balances(async_session, seller_id) == (Decimal("0.00"), hold_tx.amount)
+
+    refund_tx, release_tx = await service.process_refund(
+        order_id, buyer_id, seller_id, buyer_tx.amount, "test", admin_id=admin_id
+    )
+
+    assert refund_tx.type == TransactionType.REFUND
+    assert release_tx.type == TransactionType.RELEASE
+    assert await _balances(async_session, buyer_id) == (Decimal("200.00"), Decimal("0.00"))
+    assert await _balances(async_session, seller_id) == (Decimal("0.00"), Decimal("0.00"))
+    ledger_count = await async_session.scalar(
+        select(func.count()).select_from(Transaction).where(Transaction.reference_id == order_id)
+    )
+    assert ledger_count == 4
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_purchase_db_function_charges_buyer_and_creates_seller_wallet(async_session):
+    service = WalletService(async_session)
+    if not await service._use_purchase_db_function():
+        pytest.skip("process_purchase DB function is not installed")
+
+    admin_id = await _create_user(async_session)
+    buyer_id = await _create_user(async_session)
+    seller_id = await _create_user(async_session)
+    await service.admin_add_balance(buyer_id, Decimal("100.00"), "test", admin_id=admin_id)
+
+    buyer_tx, hold_tx = await service._process_purchase_in_db(
+        buyer_id, seller_id, Decimal("52.50"), Decimal("47.50"), str(uuid.uuid4()),
+        "buyer", "seller"
+    )
+
+    assert buyer_tx.type == TransactionType.PURCHASE_DEBIT
+    assert buyer_tx.balance_before == Decimal("100.00")
+    assert buyer_tx.balance_after == Decimal("47.50")
+    assert hold_tx.type == TransactionType.HOLD_LOCK
+    assert hold_tx.locked_after == Decimal("47.50")
+
+    # לארנק המוכר לא היה קיום לפני הרכישה - הפונקציה יצרה אותו
+    assert await _balances(async_session, buyer_id) == (Decimal("47.50"), Decimal("0.00"))
+    assert await _balances(async_session, seller_id) == (Decimal("0.00"), Decimal("47.50"))
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_purchase_db_function_insufficient_funds_keeps_session_usable(async_session):
+    service = WalletService(async_session)
+    if not await service._use_purchase_db_function():
+        pytest.skip("process_purchase DB function is not installed")
+
+    admin_id = await _create_user(async_session)
+    buyer_id = await _create_user(async_session)
+    seller_id = await _create_user(async_session)
+    await service.admin_add_balance(buyer_id, Decimal("10.00"), "test", admin_id=admin_id)
+
+    with pytest.raises(InsufficientFundsError):
+        await service._process_purchase_in_db(
+            buyer_id, seller_id, Decimal("52.50"), Decimal("47.50"), str(uuid.uuid4()),
+            "buyer", "seller"
+        )
+
+    # רק ה-savepoint בוטל - הטרנזקציה של הקורא ממשיכה
+    assert await _balances(async_session, buyer_id) == (Decimal("10.00"), Decimal("0.00"))
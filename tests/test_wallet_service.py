@@ -0,0 +1,59 @@
+from decimal import Decimal
+
+from app.models.user import TransactionType, _calculate_fees, calculate_fees
+from app.services.wallet_service import _BALANCE_EFFECTS, WalletService
+
+
+async def test_balance_display_is_served_from_cache_until_invalidated(fake_redis, fake_session):
+    # fake_session נכשל על כל שאילתה - היתרה חייבת להגיע מה-cache
+    fake_redis.values["wallet:7"] = {"total": "100.00", "locked": "40.00", "available": "60.00"}
+    service = WalletService(fake_session, redis_client=fake_redis)
+
+    balance = await service.get_balance_display(7)
+    assert balance == {
+        "total": Decimal("100.00"),
+        "locked": Decimal("40.00"),
+        "available": Decimal("60.00"),
+    }
+
+    await service._invalidate_wallet_cache(7)
+    assert await service._load_wallet_cache(7) is None
+
+
+async def test_wallet_cache_is_invalidated_only_after_commit(fake_redis, fake_session):
+    fake_redis.values["wallet:7"] = {"total": "100.00", "locked": "0.00", "available": "100.00"}
+    fake_redis.values["wallet:8"] = {"total": "5.00", "locked": "0.00", "available": "5.00"}
+    service = WalletService(fake_session, redis_client=fake_redis)
+
+    service._invalidate_wallet_cache_after_commit(7)
+    await fake_session.rollback()
+    assert "wallet:7" in fake_redis.values
+
+    service._invalidate_wallet_cache_after_commit(7)
+    service._invalidate_wallet_cache_after_commit(8)
+    assert "wallet:7" in fake_redis.values
+
+    await fake_session.commit()
+    assert "wallet:7" not in fake_redis.values
+    assert "wallet:8" not in fake_redis.values
+
+
+def test_every_transaction_type_has_a_balance_effect():
+    assert set(_BALANCE_EFFECTS) == set(TransactionType)
+
+
+def test_calculate_fees_reuses_cached_result_for_equal_amounts():
+    _calculate_fees.cache_clear()
+
+    first = calculate_fees(Decimal("10"), is_buyer=True, seller_verified=True)
+    second = calculate_fees(Decimal("10.00"), is_buyer=True, seller_verified=True)
+
+    assert first == second
+    assert _calculate_fees.cache_info().hits == 1
+
+
+def test_calculate_fees_keeps_sub_cent_amounts():
+    buyer_fee, seller_fee = calculate_fees(Decimal("0.004"), is_buyer=True, seller_verified=True)
+
+    assert buyer_fee == Decimal("0.004") * Decimal("2.0") / Decimal("100")
+    assert seller_fee == Decimal("0.004") * Decimal("3.0") / Decimal("100")